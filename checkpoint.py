@@ -0,0 +1,32 @@
+import json
+import os
+import threading
+
+# Append-only JSONL checkpoints for long evaluation runs. Every finished
+# example is written as one line {"key": ..., "record": ...} as soon as it
+# completes, so a crashed or killed run can be resumed by skipping the keys
+# already present in the checkpoint file.
+
+_lock = threading.Lock()
+
+def load_checkpoint(path: str) -> dict:
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Partially written last line from an interrupted run
+                continue
+            records[entry["key"]] = entry["record"]
+    return records
+
+def append_checkpoint(path: str, key: str, record: dict) -> None:
+    line = json.dumps({"key": key, "record": record}) + "\n"
+    with _lock:
+        with open(path, 'a') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
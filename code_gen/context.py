@@ -0,0 +1,88 @@
+import re
+from typing import Dict, List
+
+# Builds the project state context of the LLMPC prompts within a token budget.
+# Files touched by the current plan are inlined in full with line numbers, as
+# MODIFY_FILE needs them, every other file is reduced to an outline of its
+# declarations (keeping their line numbers). When the budget is still
+# exceeded outlines, then full files, are reduced to a one line entry, the
+# largest first.
+
+# Lines kept in outlines: functions, classes, variables holding functions or
+# objects, CSS rule headers and the main HTML elements
+OUTLINE_PATTERN = re.compile(
+    r"^\s*(?:export\s+)?(?:async\s+)?(?:function\b|class\b|def\b)"
+    r"|^\s*(?:export\s+)?(?:const|let|var)\s+\w+\s*=\s*(?:function\b|async\b|class\b|\(|\{|\[|new\b)"
+    r"|^\s*(?:static\s+|async\s+|get\s+|set\s+)*(?!(?:if|for|while|switch|catch|return)\b)\w+\s*\([^)]*\)\s*\{"
+    r"|^[^\s{}][^{}]*\{\s*$"
+    r"|^\s*<(?:head|body|script|link|canvas|div|section|main|header|footer|button)\b"
+)
+
+def count_tokens(text: str) -> int:
+    # ~4 characters per token, the estimate used by llm_client
+    return (len(text) + 3) // 4
+
+def number_lines(lines: List[str]) -> str:
+    return "\n".join(f"{i} {line.rstrip()}" for i, line in lines)
+
+class ContextBuilder:
+    def __init__(self, max_tokens: int = 8000):
+        self.max_tokens = max_tokens
+        # filename -> (text, full section, outline section), rebuilt when the text changes
+        self.sections = {}
+        self.num_tokens = 0
+
+    def focus_files(self, files: Dict[str, str], text: str) -> List[str]:
+        # Files named in a plan, e.g. "Add the game loop to script.js"
+        return [filename for filename in files if re.search(rf"(?<![\w.]){re.escape(filename)}(?!\.?\w)", text)]
+
+    def file_sections(self, filename: str, text: str):
+        if filename not in self.sections or self.sections[filename][0] != text:
+            lines = list(enumerate(text.splitlines()))
+            full = f"File: {filename}\n" + number_lines(lines)
+            outline = [(i, line) for i, line in lines if OUTLINE_PATTERN.search(line)]
+            outline = f"File: {filename} (outline of {len(lines)} lines)\n" + number_lines(outline)
+            self.sections[filename] = (text, full, outline)
+        return self.sections[filename][1:]
+
+    def build(self, files: Dict[str, str], focus: List[str] = ()) -> str:
+        for filename in list(self.sections):
+            if filename not in files:
+                del self.sections[filename]
+
+        # Level of detail of each file: 0 full, 1 outline, 2 name only
+        levels = {filename: 0 if filename in focus else 1 for filename in files}
+
+        def section(filename):
+            if levels[filename] == 2:
+                return f"File: {filename} ({len(files[filename].splitlines())} lines, content omitted)"
+            return self.file_sections(filename, files[filename])[levels[filename]]
+
+        tokens = {filename: count_tokens(section(filename)) for filename in files}
+        total = sum(tokens.values())
+
+        # Reduce other files to their names, then focus files to outlines and
+        # names, largest first until the context fits
+        passes = [
+            ([f for f in files if f not in focus], 2),
+            ([f for f in files if f in focus], 1),
+            ([f for f in files if f in focus], 2),
+        ]
+        for candidates, level in passes:
+            for filename in sorted(candidates, key=lambda f: -tokens[f]):
+                if total <= self.max_tokens:
+                    break
+                levels[filename] = level
+                new_tokens = count_tokens(section(filename))
+                total += new_tokens - tokens[filename]
+                tokens[filename] = new_tokens
+
+        # Hard limit: leave out the remaining entries from the end
+        included = list(files)
+        while total > self.max_tokens and included:
+            total -= tokens[included.pop()]
+        context = "\n\n".join(section(filename) for filename in included)
+        if len(included) < len(files):
+            context += f"\n\n... {len(files) - len(included)} more files omitted"
+        self.num_tokens = count_tokens(context)
+        return context
@@ -1,6 +1,6 @@
 import os
 from tools import CodeGenerator
-from openai import OpenAI
+from context import ContextBuilder
 
 system_prompt ="""
 You are an intelligent software engineering AI assistant.
@@ -15,6 +15,8 @@ The previous actions you took are:
 The relevant project state context is:
 {context}
 
+Files not needed for the current steps, or too large for the context, are shown as an outline of their declarations (with their original line numbers) or by name only.
+
 """
 
 prompt_planner = """
@@ -36,52 +38,57 @@ You have access to the following tools:
 - CREATE_FILE(filename): Creates a new empty file
 - APPEND_TO_FILE(filename, content): Adds content to the end of a file
 - MODIFY_FILE(filename, start_line, end_line, content): Replaces file content from start_line (inclusive) to end_line (inclusive) with supplied content
+- APPLY_PATCH(filename, patch): Edits a file with a unified diff (@@ hunks with a few lines of context) or with one or more search/replace blocks:
+<<<<<<< SEARCH
+lines to find
+=======
+replacement lines
+>>>>>>> REPLACE
 - REMOVE_FILE(filename): Moves a file to the removed folder
 
-When using tools, wrap the tool call in <tool></tool> tags and format as JSON:
-<tool>
-{{
-    "name": "CREATE_FILE",
-    "arguments": {{
-        "filename": "example.txt"
-    }}
-}}
-</tool>
+{tool_format}
 
-Only ever submit one MODIFY_FILE call per file. Submitting multiple MODIFY_FILE calls for the same file does not work.
+Prefer APPLY_PATCH for small changes to existing files, it only needs the changed lines. You can submit several MODIFY_FILE calls for the same file. Their line numbers always refer to the file as shown in the project state context, so earlier calls do not shift them, but the replaced line ranges must not overlap. Do not edit a file with MODIFY_FILE and other tools in the same response, such MODIFY_FILE calls are rejected.
 
 Now please execute the plan.
 """
 
+text_tool_format = """When using tools, wrap the tool call in <tool></tool> tags and format as JSON:
+<tool>
+{
+    "name": "CREATE_FILE",
+    "arguments": {
+        "filename": "example.txt"
+    }
+}
+</tool>"""
+
+native_tool_format = "Use the tools by calling them as functions, you can make several calls in one response."
+
 class LLMPC:
-    def __init__(self, api_key: str, goal: str, output_log=None, seed=0):
-        self.generator = CodeGenerator(api_key)
+    def __init__(self, api_key: str, goal: str, output_log=None, seed=0, max_context_tokens=8000, stream=False,
+                 native_tools=False):
+        self.generator = CodeGenerator(api_key, stream=stream, native_tools=native_tools)
         self.goal = goal
         self.actions = []
+        self.last_plan = []
         self.context = ""
+        self.context_builder = ContextBuilder(max_context_tokens)
 
         self.output_log = output_log
         self.seed=seed
 
-    def update_context(self):
-        files_context = []
-        files_dir = "./files"
-        
-        if not os.path.exists(files_dir):
-            return
-            
-        for filename in os.listdir(files_dir):
-            file_path = os.path.join(files_dir, filename)
-            if os.path.isfile(file_path):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-                    numbered_lines = [f"{i} {line.rstrip()}" for i, line in enumerate(lines)]
-                    files_context.append(f"File: {filename}\n" + "\n".join(numbered_lines))
-        
-        self.context = "\n\n".join(files_context)
-
-    def get_system_prompt(self, template: str, **kwargs) -> str:
-        self.update_context()  # Update context before generating prompt
+    def update_context(self, plan: list = ()):
+        # Full text of the files named in the plan, outlines of the others,
+        # within the context token budget. Files are read from the tools'
+        # workspace, which only rereads files changed on disk.
+        files = self.generator.tools.workspace.texts()
+        focus = self.context_builder.focus_files(files, "\n".join(plan))
+        self.context = self.context_builder.build(files, focus)
+        print(f"Context: {len(files)} files, {self.context_builder.num_tokens} tokens")
+
+    def get_system_prompt(self, template: str, plan: list = (), **kwargs) -> str:
+        self.update_context(plan)  # Update context before generating prompt
         return template.format(
             goal=self.goal,
             actions="\n".join(f"- {action}" for action in self.actions),
@@ -90,7 +97,7 @@ class LLMPC:
         ) 
 
     def plan(self, k: int = 3) -> list:
-        prompt = self.get_system_prompt(system_prompt)
+        prompt = self.get_system_prompt(system_prompt, self.last_plan)
         instruction = prompt_planner.format(k=k)
         print(prompt, instruction)
         response = self.generator.client.chat.completions.create(
@@ -123,8 +130,9 @@ class LLMPC:
 
     def execute(self, plan: list) -> None:
         plan_string ="\n".join(f"{i+1}. {step}" for i, step in enumerate(plan))
-        prompt = self.get_system_prompt(system_prompt)
-        instruction = prompt_executor.format(plan=plan_string)
+        prompt = self.get_system_prompt(system_prompt, plan)
+        tool_format = native_tool_format if self.generator.native_tools else text_tool_format
+        instruction = prompt_executor.format(plan=plan_string, tool_format=tool_format)
         print(prompt, instruction)
         content = self.generator.generate(prompt, instruction, self.seed)
 
@@ -138,6 +146,7 @@ class LLMPC:
             f.close()
 
         self.actions.extend(plan)
+        self.last_plan = plan
 
 ###########
 # Main code
@@ -161,7 +170,12 @@ f.close()
 
 seed=42
 
-llmpc = LLMPC(api_key, goal, output_log=output_log, seed=seed)
+# Execute tool calls while the response is streamed
+stream = True
+# Declare the file tools as native function calls instead of <tool> blocks
+native_tools = False
+
+llmpc = LLMPC(api_key, goal, output_log=output_log, seed=seed, stream=stream, native_tools=native_tools)
 
 # Run multiple iterations of planning and execution
 for iteration in range(3):
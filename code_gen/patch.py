@@ -0,0 +1,194 @@
+import difflib
+import re
+from typing import List, Tuple
+
+# Applies APPLY_PATCH edits to the lines of a file. A patch is either a
+# unified diff (hunks starting with @@ -a,b +c,d @@, file headers are
+# ignored) or one or more search/replace blocks:
+#
+# <<<<<<< SEARCH
+# lines to find
+# =======
+# replacement lines
+# >>>>>>> REPLACE
+#
+# Every hunk is located in the file before any of them is applied: first
+# exactly, then ignoring whitespace, then fuzzily on windows anchored at an
+# identical line. Context lines of a fuzzy match keep their text from the
+# file. Among several matches the one closest to the hunk's line number, or
+# the first after the previous hunk, is used. Hunks that can not be located or
+# that overlap fail the whole patch with a PatchError saying which and why.
+
+# Minimum mean similarity of the lines of a fuzzy match
+FUZZY_THRESHOLD = 0.8
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+\d+(?:,\d+)? @@")
+
+class PatchError(Exception):
+    pass
+
+class Hunk:
+    def __init__(self, ops: List[Tuple[str, str]], hint: int = None):
+        # ops are (" ", context), ("-", removed) or ("+", added) lines
+        self.ops = ops
+        self.hint = hint
+        self.old = [text for op, text in ops if op != "+"]
+
+    def apply(self, window: List[str]) -> List[str]:
+        new_lines = []
+        old = iter(window)
+        for op, text in self.ops:
+            if op == " ":
+                new_lines.append(next(old))
+            elif op == "-":
+                next(old)
+            else:
+                new_lines.append(text + "\n")
+        return new_lines
+
+def parse_patch(patch: str) -> List[Hunk]:
+    lines = patch.split("\n")
+    if any(line.startswith("<<<<<<< SEARCH") for line in lines):
+        return parse_search_replace(lines)
+    return parse_unified_diff(lines)
+
+def parse_search_replace(lines: List[str]) -> List[Hunk]:
+    hunks = []
+    section = None
+    for number, line in enumerate(lines, 1):
+        if line.startswith("<<<<<<< SEARCH"):
+            if section is not None:
+                raise PatchError(f"line {number}: SEARCH block started before the previous one was closed")
+            section, search, replace = "search", [], []
+        elif line.startswith("=======") and section == "search":
+            section = "replace"
+        elif line.startswith(">>>>>>> REPLACE") and section == "replace":
+            hunks.append(Hunk([("-", text) for text in search] + [("+", text) for text in replace]))
+            section = None
+        elif section == "search":
+            search.append(line)
+        elif section == "replace":
+            replace.append(line)
+    if section is not None:
+        raise PatchError("last SEARCH block is not closed with >>>>>>> REPLACE")
+    return hunks
+
+def parse_unified_diff(lines: List[str]) -> List[Hunk]:
+    hunks = []
+    ops = None
+    for number, line in enumerate(lines, 1):
+        match = HUNK_HEADER.match(line)
+        if match:
+            ops = []
+            # Hunks number lines from 1, -a,0 inserts after line a
+            start = int(match.group(1))
+            hint = start if match.group(2) == "0" else max(start - 1, 0)
+            hunks.append(Hunk(ops, hint))
+        elif ops is None or line.startswith("\\") or line.startswith("```"):
+            continue
+        elif line.startswith("--- ") and number < len(lines) and lines[number].startswith("+++ "):
+            # Header of the next file, lines[number] is the line after it
+            ops = None
+        elif line[:1] in (" ", "-", "+"):
+            ops.append((line[0], line[1:]))
+        elif line == "":
+            # Blank context lines often lose their leading space
+            ops.append((" ", ""))
+        else:
+            raise PatchError(f"line {number}: expected a diff line starting with ' ', '-' or '+', got {line!r}")
+
+    for hunk in hunks:
+        # Trailing blank lines of the patch text are not context
+        while hunk.ops and hunk.ops[-1] == (" ", ""):
+            hunk.ops.pop()
+        hunk.old = [text for op, text in hunk.ops if op != "+"]
+    if not hunks:
+        raise PatchError("no hunks found, expected a unified diff or SEARCH/REPLACE blocks")
+    return hunks
+
+def similarity(a: str, b: str) -> float:
+    a, b = a.strip(), b.strip()
+    if a == b:
+        return 1.0
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+def locate(lines: List[str], hunk: Hunk, after: int) -> int:
+    # Start of the window of lines matching hunk.old, preferring the hunk's
+    # line number, or else the first match after the previous hunk
+    size = len(hunk.old)
+    if size == 0:
+        return len(lines) if hunk.hint is None else min(hunk.hint, len(lines))
+
+    def closest(starts):
+        if hunk.hint is not None:
+            return min(starts, key=lambda start: (abs(start - hunk.hint), start))
+        later = [start for start in starts if start >= after]
+        return later[0] if later else starts[0]
+
+    texts = [line.rstrip("\n") for line in lines]
+    for normalize in (lambda text: text, lambda text: " ".join(text.split())):
+        old = [normalize(text) for text in hunk.old]
+        first = old[0]
+        starts = [start for start in range(len(texts) - size + 1)
+                  if normalize(texts[start]) == first
+                  and all(normalize(texts[start + i]) == old[i] for i in range(1, size))]
+        if starts:
+            return closest(starts)
+
+    # Fuzzy: windows placing any line of the hunk on an identical line
+    positions = {}
+    for i, text in enumerate(texts):
+        positions.setdefault(text.strip(), []).append(i)
+    candidates = set()
+    for i, text in enumerate(hunk.old):
+        if text.strip():
+            candidates.update(p - i for p in positions.get(text.strip(), []) if 0 <= p - i <= len(texts) - size)
+
+    scores = {start: sum(similarity(texts[start + i], hunk.old[i]) for i in range(size)) / size
+              for start in candidates}
+    matches = [start for start, score in scores.items() if score >= FUZZY_THRESHOLD]
+    if matches:
+        best = max(scores[start] for start in matches)
+        return closest(sorted(start for start in matches if scores[start] == best))
+
+    message = "could not find the lines\n" + "\n".join(hunk.old)
+    if scores:
+        start = max(scores, key=scores.get)
+        differs = next(i for i in range(size) if texts[start + i].strip() != hunk.old[i].strip())
+        message += (f"\nclosest match starts at line {start} ({scores[start]:.0%} similar), "
+                    f"line {start + differs} is {texts[start + differs]!r} instead of {hunk.old[differs]!r}")
+    raise PatchError(message)
+
+def replace_ranges(lines: List[str], ranges: List[Tuple[int, int, List[str]]]) -> List[str]:
+    # Replace sorted, non-overlapping [start, stop) ranges by new lines in one
+    # pass
+    new_file = []
+    position = 0
+    for start, stop, new_lines in ranges:
+        new_file.extend(lines[position:start])
+        # A last line without newline joins the line written after it
+        if new_file and new_lines and not new_file[-1].endswith("\n"):
+            new_file[-1] += new_lines[0]
+            new_lines = new_lines[1:]
+        new_file.extend(new_lines)
+        position = stop
+    new_file.extend(lines[position:])
+    return new_file
+
+def apply_patch(lines: List[str], patch: str) -> List[str]:
+    ranges = []
+    after = 0
+    for number, hunk in enumerate(parse_patch(patch), 1):
+        try:
+            start = locate(lines, hunk, after)
+        except PatchError as e:
+            raise PatchError(f"hunk {number}: {e}")
+        stop = start + len(hunk.old)
+        ranges.append((start, stop, number, hunk.apply(lines[start:stop])))
+        after = stop
+    ranges.sort()
+
+    for (start, stop, i, _), (next_start, _, j, _) in zip(ranges, ranges[1:]):
+        if next_start < stop:
+            raise PatchError(f"hunks {i} and {j} overlap at lines {next_start}-{stop - 1}")
+    return replace_ranges(lines, [(start, stop, new_lines) for start, stop, _, new_lines in ranges])
@@ -1,6 +1,6 @@
 import os
 from tools import CodeGenerator
-from openai import OpenAI
+from llm_client import get_client
 
 def main():
     system_prompt = """You are an expert code generation AI that creates high quality, clean, modular maintainable code.
@@ -52,7 +52,7 @@ def main():
     if not api_key:
         raise ValueError("OPENAI_KEY environment variable not set")
 
-    client = OpenAI(api_key=api_key)
+    client = get_client(api_key)
 
     instruction = """The client has asked you to complete the following project:
     
@@ -1,20 +1,148 @@
 import os
 import re
+import sys
 import json
-from openai import OpenAI
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from llm_client import get_client, stream_content
+from patch import apply_patch, replace_ranges
 from typing import List, Tuple
 
+def split_lines(text: str) -> List[str]:
+    # Lines with their newline, like readlines()
+    lines = text.split('\n')
+    return [line + '\n' for line in lines[:-1]] + ([lines[-1]] if lines[-1] else [])
+
+class Workspace:
+    # In-memory copy of the files directory. Tool calls edit per-file line
+    # buffers, flush() writes the files changed since the last flush at once:
+    # every new version is first written to a temporary file next to its
+    # target, then all of them replace their targets, so a failing write
+    # leaves the directory as it was. Clean buffers are kept between turns
+    # and only reread when the file on disk changed. Removed files are moved
+    # to removed_dir unchanged, binary files included.
+    def __init__(self, base_dir: str, removed_dir: str):
+        self.base_dir = base_dir
+        self.removed_dir = removed_dir
+        self.buffers = {}
+        self.signatures = {}
+        self.dirty = set()
+        self.removed = {}
+
+    def path(self, filename: str) -> str:
+        return os.path.join(self.base_dir, filename)
+
+    def signature(self, filename: str):
+        stat = os.stat(self.path(filename))
+        return stat.st_mtime_ns, stat.st_size
+
+    def exists(self, filename: str) -> bool:
+        if filename in self.buffers:
+            return True
+        return filename not in self.removed and os.path.isfile(self.path(filename))
+
+    def lines(self, filename: str) -> List[str]:
+        if filename in self.dirty:
+            return self.buffers[filename]
+        if not self.exists(filename):
+            raise FileNotFoundError(f"No such file: {filename}")
+        signature = self.signature(filename)
+        if self.signatures.get(filename) != signature:
+            with open(self.path(filename), 'r') as f:
+                self.buffers[filename] = split_lines(f.read())
+            self.signatures[filename] = signature
+        return self.buffers[filename]
+
+    def write(self, filename: str, lines: List[str]) -> None:
+        if not os.path.isdir(os.path.dirname(self.path(filename))):
+            raise FileNotFoundError(f"No such directory: {os.path.dirname(filename)}")
+        self.buffers[filename] = lines
+        self.dirty.add(filename)
+
+    def remove(self, filename: str) -> None:
+        destination = os.path.join(self.removed_dir, filename)
+        if not os.path.isdir(os.path.dirname(destination)):
+            raise FileNotFoundError(f"No such directory: {os.path.dirname(destination)}")
+        if not self.exists(filename):
+            raise FileNotFoundError(f"No such file: {filename}")
+        # Unflushed edits are written to the removed folder, files as they
+        # are on disk are moved there by flush()
+        self.removed[filename] = self.buffers[filename] if filename in self.dirty else None
+        self.buffers.pop(filename, None)
+        self.signatures.pop(filename, None)
+        self.dirty.discard(filename)
+
+    def texts(self) -> dict:
+        # {filename: text} of every file, binary files are left out
+        filenames = []
+        if os.path.isdir(self.base_dir):
+            filenames = [f for f in sorted(os.listdir(self.base_dir))
+                         if f not in self.removed and os.path.isfile(self.path(f))]
+        filenames += sorted(f for f in self.dirty if f not in filenames)
+        texts = {}
+        for filename in filenames:
+            try:
+                texts[filename] = "".join(self.lines(filename))
+            except UnicodeDecodeError:
+                continue
+        return texts
+
+    def flush(self) -> None:
+        staged = []
+        try:
+            for filename in sorted(self.dirty):
+                staged.append((self.stage(self.path(filename), self.buffers[filename]), self.path(filename)))
+            for filename, lines in self.removed.items():
+                if lines is not None:
+                    staged.append((self.stage(os.path.join(self.removed_dir, filename), lines), os.path.join(self.removed_dir, filename)))
+        except:
+            for tmp_path, _ in staged:
+                os.remove(tmp_path)
+            raise
+
+        # Removed files leave before files created again take their place
+        for filename, lines in self.removed.items():
+            if lines is None:
+                os.replace(self.path(filename), os.path.join(self.removed_dir, filename))
+            elif filename not in self.dirty and os.path.isfile(self.path(filename)):
+                os.remove(self.path(filename))
+        for tmp_path, path in staged:
+            os.replace(tmp_path, path)
+        for filename in self.dirty:
+            self.signatures[filename] = self.signature(filename)
+        self.dirty.clear()
+        self.removed.clear()
+
+    def stage(self, path: str, lines: List[str]) -> str:
+        tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+        try:
+            with open(tmp_path, 'w') as f:
+                f.writelines(lines)
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return tmp_path
+
+    def discard(self) -> None:
+        # Drop the changes since the last flush
+        for filename in self.dirty:
+            del self.buffers[filename]
+            self.signatures.pop(filename, None)
+        self.dirty.clear()
+        self.removed.clear()
+
 class FileTools:
+    # File operations of the tool calls, applied to the in-memory workspace
+    # until flush() is called
     def __init__(self, base_dir: str = "./"):
         self.base_dir = os.path.join(base_dir, "files")
         self.removed_dir = os.path.join(base_dir, "removed")
         os.makedirs(self.removed_dir, exist_ok=True)
+        self.workspace = Workspace(self.base_dir, self.removed_dir)
 
     def create_file(self, filename: str) -> bool:
         try:
-            filepath = os.path.join(self.base_dir, filename)
-            with open(filepath, 'w') as f:
-                pass
+            self.workspace.write(filename, [])
             return True
         except Exception as e:
             print(f"Error creating file: {e}")
@@ -22,50 +150,160 @@ class FileTools:
 
     def append_to_file(self, filename: str, content: str) -> bool:
         try:
-            filepath = os.path.join(self.base_dir, filename)
-            with open(filepath, 'a') as f:
-                f.write(content)
+            lines = list(self.workspace.lines(filename)) if self.workspace.exists(filename) else []
+            if lines and not lines[-1].endswith('\n'):
+                content = lines.pop() + content
+            self.workspace.write(filename, lines + split_lines(content))
             return True
         except Exception as e:
             print(f"Error appending to file: {e}")
             return False
 
     def modify_file(self, filename: str, start_line: int, end_line: int, content: str) -> bool:
+        return self.modify_lines(filename, [(start_line, end_line, content)])
+
+    def modify_lines(self, filename: str, edits: List[Tuple[int, int, str]]) -> bool:
+        # Apply several (start_line, end_line, content) replacements, all
+        # numbered against the file before any of them, in one pass. Edits
+        # with end_line < start_line insert before start_line. Overlapping
+        # edits are rejected as a whole.
         try:
-            filepath = os.path.join(self.base_dir, filename)
-            with open(filepath, 'r') as f:
-                lines = f.readlines()
-            
-            # Convert content to lines
-            new_lines = content.split('\n')
-            if not new_lines[-1].strip():
-                new_lines = new_lines[:-1]
-            
+            lines = self.workspace.lines(filename)
+
+            ranges = []
+            for i, (start_line, end_line, content) in enumerate(edits):
+                # Same lines as lines[start_line:end_line+1]
+                start, stop, _ = slice(start_line, end_line+1).indices(len(lines))
+
+                # Convert content to lines
+                new_lines = content.split('\n')
+                if not new_lines[-1].strip():
+                    new_lines = new_lines[:-1]
+                ranges.append((start, max(start, stop), i, [line + '\n' for line in new_lines]))
+            ranges.sort()
+
+            for (start, stop, i, _), (next_start, next_stop, j, _) in zip(ranges, ranges[1:]):
+                if next_start < stop:
+                    raise ValueError(
+                        f"lines {edits[i][0]}-{edits[i][1]} and {edits[j][0]}-{edits[j][1]} overlap"
+                    )
+
             # Replace lines
-            lines[start_line:end_line+1] = [line + '\n' for line in new_lines]
-            
-            with open(filepath, 'w') as f:
-                f.writelines(lines)
+            new_file = replace_ranges(lines, [(start, stop, new_lines) for start, stop, _, new_lines in ranges])
+            self.workspace.write(filename, new_file)
             return True
         except Exception as e:
             print(f"Error modifying file: {e}")
             return False
 
+    def apply_patch(self, filename: str, patch: str) -> bool:
+        try:
+            self.workspace.write(filename, apply_patch(self.workspace.lines(filename), patch))
+            return True
+        except Exception as e:
+            print(f"Error applying patch to {filename}: {e}")
+            return False
+
     def remove_file(self, filename: str) -> bool:
         try:
-            source = os.path.join(self.base_dir, filename)
-            destination = os.path.join(self.removed_dir, filename)
-            os.rename(source, destination)
+            self.workspace.remove(filename)
             return True
         except Exception as e:
             print(f"Error removing file: {e}")
             return False
 
+    def flush(self) -> bool:
+        try:
+            self.workspace.flush()
+            return True
+        except Exception as e:
+            print(f"Error writing files: {e}")
+            self.workspace.discard()
+            return False
+
+class ToolCallScanner:
+    # Incremental version of re.findall(r'<tool>(.*?)</tool>', text, re.DOTALL)
+    # over a streamed response: feed() returns the calls closed by a delta
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.start = None
+
+    def feed(self, delta: str) -> List[str]:
+        self.text += delta
+        calls = []
+        while True:
+            if self.start is None:
+                i = self.text.find("<tool>", self.pos)
+                if i < 0:
+                    # A tag may be split over deltas
+                    self.pos = max(self.pos, len(self.text) - len("<tool>") + 1)
+                    return calls
+                self.start = self.pos = i + len("<tool>")
+            j = self.text.find("</tool>", self.pos)
+            if j < 0:
+                self.pos = max(self.pos, len(self.text) - len("</tool>") + 1)
+                return calls
+            calls.append(self.text[self.start:j])
+            self.start, self.pos = None, j + len("</tool>")
+
+def function_schema(name: str, description: str, **properties) -> dict:
+    return {
+        "type": "function",
+        "function": {
+            "name": name,
+            "description": description,
+            "parameters": {
+                "type": "object",
+                "properties": {key: {"type": kind} for key, kind in properties.items()},
+                "required": list(properties),
+                "additionalProperties": False,
+            },
+        },
+    }
+
+# The file tools declared as native function calls
+TOOL_SCHEMAS = [
+    function_schema("CREATE_FILE", "Creates a new empty file", filename="string"),
+    function_schema("APPEND_TO_FILE", "Adds content to the end of a file", filename="string", content="string"),
+    function_schema("MODIFY_FILE", "Replaces file content from start_line (inclusive) to end_line (inclusive) with supplied content",
+                    filename="string", start_line="integer", end_line="integer", content="string"),
+    function_schema("APPLY_PATCH", "Edits a file with a unified diff or search/replace blocks", filename="string", patch="string"),
+    function_schema("REMOVE_FILE", "Moves a file to the removed folder", filename="string"),
+]
+
 class CodeGenerator:
-    def __init__(self, api_key: str):
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, api_key: str, stream: bool = False, abort_on_error: bool = True, native_tools: bool = False):
+        self.client = get_client(api_key)
         self.tools = FileTools()
+        # Execute tool calls while the response is streamed, stopping the
+        # stream at the first call that can not be parsed or fails
+        self.stream = stream
+        self.abort_on_error = abort_on_error
+        # Receive the tool calls as native function calls with structured
+        # arguments instead of <tool> blocks in the text
+        self.native_tools = native_tools
         
+    def parse_tool_call(self, call: str):
+        try:
+            call_data = json.loads(call)
+            if not isinstance(call_data['arguments'], dict):
+                raise ValueError("arguments are not an object")
+            return call_data['name'], call_data['arguments']
+        except:
+            print(f"Failed to parse tool call: {call}")
+            return None
+
+    def parse_function_call(self, name: str, arguments: str):
+        try:
+            args = json.loads(arguments)
+            if not isinstance(args, dict):
+                raise ValueError("arguments are not an object")
+            return name, args
+        except Exception as e:
+            print(f"Failed to parse arguments of {name}: {e}")
+            return None
+
     def parse_tool_calls(self, text: str) -> List[Tuple[str, dict]]:
         # Regular expression to match tool calls
         pattern = r'<tool>(.*?)</tool>'
@@ -73,38 +311,148 @@ class CodeGenerator:
         
         parsed_calls = []
         for call in tool_calls:
-            try:
-                call_data = json.loads(call)
-                parsed_calls.append((call_data['name'], call_data['arguments']))
-            except:
-                print(f"Failed to parse tool call: {call}")
+            parsed = self.parse_tool_call(call)
+            if parsed is not None:
+                parsed_calls.append(parsed)
                 
         return parsed_calls
 
     def execute_tool_calls(self, tool_calls: List[Tuple[str, dict]]) -> List[bool]:
-        results = []
-        for tool_name, args in tool_calls:
+        # MODIFY_FILE line numbers refer to the file as it was shown to the
+        # model, so all MODIFY_FILE calls of a file are applied together at the
+        # first one. That only matches the order of the calls when nothing
+        # else edits the file, MODIFY_FILE calls on a file that other calls of
+        # the response edit as well are rejected.
+        modifications = {}
+        edited = set()
+        for i, (tool_name, args) in enumerate(tool_calls):
+            if tool_name == "MODIFY_FILE":
+                modifications.setdefault(args['filename'], []).append(i)
+            else:
+                edited.add(args.get('filename'))
+
+        results = [None] * len(tool_calls)
+        for i, (tool_name, args) in enumerate(tool_calls):
+            if results[i] is not None:
+                continue
             if tool_name == "CREATE_FILE":
                 result = self.tools.create_file(args['filename'])
             elif tool_name == "APPEND_TO_FILE":
                 result = self.tools.append_to_file(args['filename'], args['content'])
             elif tool_name == "MODIFY_FILE":
-                result = self.tools.modify_file(
-                    args['filename'],
-                    args['start_line'],
-                    args['end_line'],
-                    args['content']
-                )
+                calls = modifications[args['filename']]
+                if args['filename'] in edited:
+                    result = self.reject_modifications(args['filename'])
+                else:
+                    result = self.tools.modify_lines(
+                        args['filename'],
+                        [(tool_calls[j][1]['start_line'], tool_calls[j][1]['end_line'], tool_calls[j][1]['content'])
+                         for j in calls]
+                    )
+                for j in calls:
+                    results[j] = result
+            elif tool_name == "APPLY_PATCH":
+                result = self.tools.apply_patch(args['filename'], args['patch'])
             elif tool_name == "REMOVE_FILE":
                 result = self.tools.remove_file(args['filename'])
             else:
                 print(f"Unknown tool: {tool_name}")
                 result = False
-            results.append(result)
+            results[i] = result
         return results
 
+    def reject_modifications(self, filename: str) -> bool:
+        print(f"MODIFY_FILE {filename}: rejected, other tool calls of the response edit the file")
+        return False
+
+    def stream_text_calls(self, stream, content: List[str]):
+        # Tool calls of a streamed response, each as soon as it is closed
+        scanner = ToolCallScanner()
+        for delta in stream_content(stream):
+            content.append(delta)
+            for call in scanner.feed(delta):
+                yield self.parse_tool_call(call)
+
+    def stream_native_calls(self, stream, content: List[str]):
+        # Function calls arrive one after the other, a call is complete when
+        # the next one starts or the stream ends
+        current = None
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content.append(delta.content)
+            for call in delta.tool_calls or []:
+                if current is not None and call.index != current[0]:
+                    yield self.parse_function_call(current[1], current[2])
+                    current = None
+                if current is None:
+                    current = [call.index, "", ""]
+                if call.function is not None:
+                    current[1] += call.function.name or ""
+                    current[2] += call.function.arguments or ""
+        if current is not None:
+            yield self.parse_function_call(current[1], current[2])
+
+    def generate_streaming(self, request: dict):
+        # Returns (content, tool_calls, results) like the batch path. Calls are
+        # executed as soon as they are closed, except that MODIFY_FILE calls
+        # wait for the end of the stream as they are applied together. As in
+        # execute_tool_calls, MODIFY_FILE calls on a file that other calls
+        # edit are rejected, as soon as the other call arrives.
+        stream = self.client.chat.completions.create(stream=True, **request)
+        content = []
+        if self.native_tools:
+            calls = self.stream_native_calls(stream, content)
+        else:
+            calls = self.stream_text_calls(stream, content)
+
+        tool_calls, results = [], []
+        deferred = {}
+        edited = set()
+        aborted = False
+        for parsed in calls:
+            if parsed is None:
+                aborted = self.abort_on_error
+                if aborted:
+                    break
+                continue
+            tool_calls.append(parsed)
+            results.append(None)
+            tool_name, args = parsed
+            filename = args.get('filename')
+            if tool_name == "MODIFY_FILE" and filename not in edited:
+                deferred.setdefault(filename, []).append(len(tool_calls) - 1)
+                print(f"{tool_name} {filename}: deferred to the end of the response")
+                continue
+            rejected = False
+            if tool_name == "MODIFY_FILE":
+                results[-1] = self.reject_modifications(filename)
+            else:
+                edited.add(filename)
+                if filename in deferred:
+                    self.reject_modifications(filename)
+                    for i in deferred.pop(filename):
+                        results[i] = False
+                    rejected = True
+                results[-1] = self.execute_tool_calls([parsed])[0]
+            print(f"{tool_name} {filename}: {'Success' if results[-1] else 'Failed'}")
+            if (rejected or not results[-1]) and self.abort_on_error:
+                aborted = True
+                break
+        if aborted:
+            print("Stopping the response after a failed tool call")
+            # Stops the generation, the rest of max_tokens is not spent
+            stream.close()
+
+        for indices in deferred.values():
+            for i, result in zip(indices, self.execute_tool_calls([tool_calls[i] for i in indices])):
+                results[i] = result
+        return "".join(content), tool_calls, results
+
     def generate(self, system_prompt:str, prompt: str, seed=0) -> str:
-        response = self.client.chat.completions.create(
+        request = dict(
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -114,13 +462,39 @@ class CodeGenerator:
             max_tokens=2000,
             seed=seed
         )
+        if self.native_tools:
+            request["tools"] = TOOL_SCHEMAS
+
+        if self.stream:
+            content, tool_calls, results = self.generate_streaming(request)
+        else:
+            response = self.client.chat.completions.create(**request)
+
+            # Get the response content
+            message = response.choices[0].message
+            content = message.content or ""
+
+            # Parse and execute tool calls
+            if self.native_tools:
+                tool_calls = [self.parse_function_call(call.function.name, call.function.arguments)
+                              for call in message.tool_calls or []]
+                tool_calls = [call for call in tool_calls if call is not None]
+            else:
+                tool_calls = self.parse_tool_calls(content)
+            results = self.execute_tool_calls(tool_calls)
 
-        # Get the response content
-        content = response.choices[0].message.content
+        # Write the changed files at once
+        if not self.tools.flush():
+            results = [False] * len(results)
 
-        # Parse and execute tool calls
-        tool_calls = self.parse_tool_calls(content)
-        results = self.execute_tool_calls(tool_calls)
+        # Function calls are not part of the text, log them in the text format
+        if self.native_tools:
+            sections = []
+            if content:
+                sections.append(content)
+            for name, args in tool_calls:
+                sections.append(f"<tool>{json.dumps({'name': name, 'arguments': args}, indent=4)}</tool>")
+            content = "\n".join(sections)
 
         # Print the response and results
         print("Assistant response:")
@@ -129,4 +503,4 @@ class CodeGenerator:
         for (tool_name, args), result in zip(tool_calls, results):
             print(f"{tool_name}: {'Success' if result else 'Failed'}")
 
-        return content
\ No newline at end of file
+        return content
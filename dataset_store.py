@@ -0,0 +1,169 @@
+import json
+import sys
+from collections.abc import Mapping
+
+import numpy as np
+import pyarrow as pa
+
+# Columnar store for the natural-plan datasets. A dataset JSON file
+# {example_id: {field: value}} is converted once to an uncompressed Arrow IPC
+# file, which is memory-mapped when loaded so only the fields that are read
+# are ever touched:
+# - string and int fields are stored as plain columns
+# - dist_matrix is stored as location ids into one location dictionary shared
+#   by all examples plus a dense int16 row-major matrix, -1 marking missing
+#   entries
+# - other nested fields (constraints, golden_plan, ...) are JSON encoded
+#
+# Convert with: python dataset_store.py meeting_planning_reduced.json meeting_planning_reduced.arrow
+
+DIST_FIELD = "dist_matrix"
+
+def _field_type(values):
+    if all(isinstance(v, str) for v in values):
+        return "string"
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        return "int"
+    return "json"
+
+def _encode_dist_matrix(dist_matrix, location_ids):
+    # Locations in order of first appearance, as rows or as destinations
+    locations = list(dist_matrix.keys())
+    seen = set(locations)
+    for row in dist_matrix.values():
+        for loc in row:
+            if loc not in seen:
+                seen.add(loc)
+                locations.append(loc)
+
+    index = {loc: i for i, loc in enumerate(locations)}
+    dist = np.full((len(locations), len(locations)), -1, dtype=np.int16)
+    for a, row in dist_matrix.items():
+        for b, minutes in row.items():
+            if not 0 <= minutes <= np.iinfo(np.int16).max:
+                raise ValueError(f"Distance {a} -> {b} of {minutes} does not fit in int16")
+            dist[index[a], index[b]] = minutes
+
+    ids = [location_ids.setdefault(loc, len(location_ids)) for loc in locations]
+    return ids, dist.ravel()
+
+def convert_dataset(json_path: str, out_path: str) -> None:
+    with open(json_path, 'r') as f:
+        data = json.load(f)
+
+    examples = list(data.values())
+    fields = []
+    for d in examples:
+        for field in d:
+            if field not in fields:
+                fields.append(field)
+
+    columns = {"example_id": pa.array(list(data.keys()), pa.string())}
+    types = {}
+    location_ids = {}
+    for field in fields:
+        values = [d.get(field) for d in examples]
+        present = [v for v in values if v is not None]
+        if field == DIST_FIELD:
+            encoded = [_encode_dist_matrix(v, location_ids) if v is not None else (None, None) for v in values]
+            columns[DIST_FIELD + ".locations"] = pa.array([ids for ids, _ in encoded], pa.list_(pa.int16()))
+            columns[DIST_FIELD + ".minutes"] = pa.array([dist for _, dist in encoded], pa.list_(pa.int16()))
+            types[field] = "dist"
+            continue
+
+        types[field] = _field_type(present)
+        if types[field] == "string":
+            columns[field] = pa.array(values, pa.large_string())
+        elif types[field] == "int":
+            columns[field] = pa.array(values, pa.int64())
+        else:
+            columns[field] = pa.array([json.dumps(v) if v is not None else None for v in values], pa.large_string())
+
+    metadata = {
+        "fields": json.dumps(fields),
+        "types": json.dumps(types),
+        "locations": json.dumps(list(location_ids)),
+    }
+    table = pa.table(columns).replace_schema_metadata(metadata)
+    with pa.OSFile(out_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+class ExampleView(Mapping):
+    # Read-only view of one example, fields are decoded on first access
+    def __init__(self, store, row: int):
+        self.store = store
+        self.row = row
+        self.cache = {}
+
+    def __getitem__(self, field):
+        if field not in self.cache:
+            self.cache[field] = self.store.value(self.row, field)
+        return self.cache[field]
+
+    def __iter__(self):
+        return (f for f in self.store.fields if self.store.has_value(self.row, f))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def dist_array(self):
+        return self.store.dist_array(self.row)
+
+class DatasetStore(Mapping):
+    # Lazy {example_id: ExampleView} mapping over a converted dataset
+    def __init__(self, path: str):
+        self.path = path
+        self.table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        metadata = self.table.schema.metadata
+        self.fields = json.loads(metadata[b"fields"])
+        self.types = json.loads(metadata[b"types"])
+        self.locations = json.loads(metadata[b"locations"])
+        self.ids = self.table.column("example_id").to_pylist()
+        self.index = {k: i for i, k in enumerate(self.ids)}
+
+    def __getitem__(self, example_id):
+        return ExampleView(self, self.index[example_id])
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def has_value(self, row: int, field: str) -> bool:
+        name = DIST_FIELD + ".minutes" if self.types.get(field) == "dist" else field
+        return field in self.types and self.table.column(name)[row].is_valid
+
+    def value(self, row: int, field: str):
+        if field not in self.types or not self.has_value(row, field):
+            raise KeyError(field)
+        kind = self.types[field]
+        if kind == "dist":
+            locations, dist = self.dist_array(row)
+            return {
+                a: {b: int(dist[i, j]) for j, b in enumerate(locations) if dist[i, j] >= 0}
+                for i, a in enumerate(locations)
+            }
+        value = self.table.column(field)[row].as_py()
+        return json.loads(value) if kind == "json" else value
+
+    def dist_array(self, row: int):
+        # (location names, (n, n) int16 matrix viewing the mapped file)
+        ids = self.table.column(DIST_FIELD + ".locations")[row].values.to_numpy()
+        dist = self.table.column(DIST_FIELD + ".minutes")[row].values.to_numpy()
+        n = len(ids)
+        return [self.locations[i] for i in ids], dist.reshape(n, n)
+
+def load_dataset(path: str):
+    # JSON datasets are loaded as before, converted ones lazily
+    if path.endswith(".json"):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return DatasetStore(path)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python dataset_store.py <dataset.json> <dataset.arrow>")
+        sys.exit(1)
+    convert_dataset(sys.argv[1], sys.argv[2])
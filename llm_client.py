@@ -0,0 +1,422 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import List
+from openai import OpenAI, AsyncOpenAI
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+# Shared OpenAI client wrapper used by all experiments. Completions are cached
+# on disk keyed by the full request (model, messages, temperature, seed,
+# max_tokens, ...) so reruns of an experiment replay without API calls.
+# Streamed and non-streamed requests share their cache entry: a streamed
+# completion is stored once it is complete and replayed as chunks.
+#
+# Set LLMPC_CACHE_PATH to move the cache, or to an empty string to disable it.
+# Set LLMPC_BACKEND=replay to serve only previously cached responses offline.
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    "LLMPC_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".llm_cache.sqlite")
+)
+DEFAULT_MAX_ENTRIES = 100000
+
+class ResponseCache:
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, response TEXT NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_access ON responses (last_access)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(request: dict) -> str:
+        # Streaming only changes how the completion is delivered
+        request = {k: v for k, v in request.items() if k not in ("stream", "stream_options")}
+        payload = json.dumps(request, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        with self.lock:
+            row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Track recency for LRU eviction
+            self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, last_access) VALUES (?, ?, ?)",
+                (key, response, time.time())
+            )
+            # Evict the least recently used entries beyond the size bound
+            count = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                self.conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self.conn.commit()
+
+def estimate_tokens(request: dict) -> int:
+    # Rough upper bound on the tokens a request consumes: ~4 characters per
+    # prompt token plus the full completion budget
+    prompt_chars = sum(len(str(message.get("content", ""))) for message in request.get("messages", []))
+    return prompt_chars // 4 + request.get("max_tokens", 0)
+
+class TokenRateLimiter:
+    # Blocks until a request fits into a sliding one minute token budget
+    def __init__(self, tokens_per_minute: int):
+        self.tokens_per_minute = tokens_per_minute
+        self.events = deque()
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: int) -> None:
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                while self.events and self.events[0][0] <= now - 60:
+                    self.used -= self.events.popleft()[1]
+                if self.used + tokens <= self.tokens_per_minute:
+                    self.events.append((now, tokens))
+                    self.used += tokens
+                    return
+                wait = self.events[0][0] + 60 - now
+            time.sleep(max(wait, 0.01))
+
+class _Completions:
+    def __init__(self, completions, cache: ResponseCache, rate_limiter: TokenRateLimiter = None):
+        self.completions = completions
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+
+    def create(self, **kwargs):
+        if self.cache is None:
+            return self.request(**kwargs)
+
+        key = ResponseCache.make_key(kwargs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            completion = ChatCompletion.model_validate_json(cached)
+            return completion_chunks(completion) if kwargs.get("stream") else completion
+
+        if kwargs.get("stream"):
+            return _CachedStream(self.request(**kwargs), self.cache, key)
+        response = self.request(**kwargs)
+        self.cache.put(key, response.model_dump_json())
+        return response
+
+    def request(self, **kwargs):
+        # Only requests that reach the API count against the token budget
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(estimate_tokens(kwargs))
+        return self.completions.create(**kwargs)
+
+class _AsyncCompletions(_Completions):
+    async def create(self, **kwargs):
+        if self.cache is None:
+            return await self.request(**kwargs)
+
+        key = ResponseCache.make_key(kwargs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            completion = ChatCompletion.model_validate_json(cached)
+            return async_chunks(completion_chunks(completion)) if kwargs.get("stream") else completion
+
+        if kwargs.get("stream"):
+            return _async_cached_stream(await self.request(**kwargs), self.cache, key)
+        response = await self.request(**kwargs)
+        self.cache.put(key, response.model_dump_json())
+        return response
+
+    async def request(self, **kwargs):
+        if self.rate_limiter is not None:
+            await asyncio.to_thread(self.rate_limiter.acquire, estimate_tokens(kwargs))
+        return await self.completions.create(**kwargs)
+
+class _Chat:
+    def __init__(self, completions):
+        self.completions = completions
+
+class CachedClient:
+    # Drop-in replacement for OpenAI/AsyncOpenAI exposing
+    # chat.completions.create, everything else is forwarded to the client.
+    def __init__(self, client, cache: ResponseCache = None, rate_limiter: TokenRateLimiter = None):
+        self.client = client
+        self.cache = cache
+        if isinstance(client, AsyncOpenAI):
+            self.chat = _Chat(_AsyncCompletions(client.chat.completions, cache, rate_limiter))
+        else:
+            self.chat = _Chat(_Completions(client.chat.completions, cache, rate_limiter))
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+def make_completion(content: str, model: str = "mock") -> ChatCompletion:
+    return ChatCompletion.model_validate({
+        "id": "mock-" + hashlib.sha256(content.encode("utf-8")).hexdigest()[:16],
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": content}
+        }]
+    })
+
+def stream_content(stream):
+    # Yield the text deltas of a stream=True completion
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def assemble_completion(chunks: List[ChatCompletionChunk]):
+    # The completion a stream of chunks adds up to, None when the stream
+    # stopped before a finish_reason
+    content, tool_calls, finish_reason = [], {}, None
+    for chunk in chunks:
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        if choice.delta.content:
+            content.append(choice.delta.content)
+        for call in choice.delta.tool_calls or []:
+            entry = tool_calls.setdefault(call.index, {"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+            entry["id"] = call.id or entry["id"]
+            if call.function is not None:
+                entry["function"]["name"] += call.function.name or ""
+                entry["function"]["arguments"] += call.function.arguments or ""
+        finish_reason = choice.finish_reason or finish_reason
+    if finish_reason is None:
+        return None
+
+    message = {"role": "assistant", "content": "".join(content) if content or not tool_calls else None}
+    if tool_calls:
+        message["tool_calls"] = [tool_calls[index] for index in sorted(tool_calls)]
+    usage = next((chunk.usage for chunk in reversed(chunks) if chunk.usage is not None), None)
+    return ChatCompletion.model_validate({
+        "id": chunks[0].id,
+        "object": "chat.completion",
+        "created": chunks[0].created,
+        "model": chunks[0].model,
+        "choices": [{"index": 0, "finish_reason": finish_reason, "message": message}],
+        "usage": usage.model_dump() if usage is not None else None
+    })
+
+def completion_chunks(completion: ChatCompletion, chunk_size: int = 16):
+    # Replay a completion as the chunks of a streamed one: its content in
+    # pieces of chunk_size characters, its tool calls, then the finish_reason
+    choice = completion.choices[0]
+    content = choice.message.content or ""
+
+    def chunk(delta: dict, finish_reason: str = None) -> ChatCompletionChunk:
+        return ChatCompletionChunk.model_validate({
+            "id": completion.id,
+            "object": "chat.completion.chunk",
+            "created": completion.created,
+            "model": completion.model,
+            "choices": [{"index": 0, "finish_reason": finish_reason, "delta": delta}]
+        })
+
+    for i in range(0, len(content), chunk_size):
+        yield chunk({"content": content[i:i + chunk_size]})
+    for index, call in enumerate(choice.message.tool_calls or []):
+        yield chunk({"tool_calls": [{
+            "index": index,
+            "id": call.id,
+            "type": "function",
+            "function": {"name": call.function.name, "arguments": call.function.arguments}
+        }]})
+    yield chunk({}, choice.finish_reason)
+
+async def async_chunks(chunks):
+    for chunk in chunks:
+        yield chunk
+
+class _CachedStream:
+    # Passes the chunks of a streamed completion through and caches the
+    # completion they add up to when the stream ends. Closing the stream
+    # early stops the generation, the incomplete completion is not cached.
+    def __init__(self, stream, cache: ResponseCache, key: str):
+        self.stream = stream
+        self.cache = cache
+        self.key = key
+        self.chunks = []
+        self.iterator = iter(stream)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self.iterator)
+        except StopIteration:
+            completion = assemble_completion(self.chunks)
+            if completion is not None:
+                self.cache.put(self.key, completion.model_dump_json())
+            raise
+        self.chunks.append(chunk)
+        return chunk
+
+    def close(self):
+        self.stream.close()
+
+async def _async_cached_stream(stream, cache: ResponseCache, key: str):
+    # Async counterpart of _CachedStream
+    chunks = []
+    async for chunk in stream:
+        chunks.append(chunk)
+        yield chunk
+    completion = assemble_completion(chunks)
+    if completion is not None:
+        cache.put(key, completion.model_dump_json())
+
+class MockBackend:
+    # Offline backend answering requests with responder(request) -> str after
+    # a simulated latency in seconds, used to benchmark the non-LLM parts of
+    # each experiment without network access. Streamed responses are split
+    # into chunks of CHUNK_SIZE characters with the latency spread over them.
+    CHUNK_SIZE = 16
+
+    def __init__(self, responder, latency: float = 0.0):
+        self.responder = responder
+        self.latency = latency
+        self.num_requests = 0
+        self.num_chunks = 0
+
+    def respond(self, request: dict) -> str:
+        return self.responder(request)
+
+    def completion(self, request: dict) -> ChatCompletion:
+        return make_completion(self.respond(request), request.get("model", "mock"))
+
+    def complete(self, request: dict) -> ChatCompletion:
+        self.num_requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self.completion(request)
+
+    async def acomplete(self, request: dict) -> ChatCompletion:
+        self.num_requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.completion(request)
+
+    def chunks(self, request: dict) -> List[ChatCompletionChunk]:
+        return list(completion_chunks(self.completion(request), self.CHUNK_SIZE))
+
+    def stream(self, request: dict):
+        self.num_requests += 1
+        chunks = self.chunks(request)
+        # The last chunk only carries the finish_reason
+        for chunk in chunks[:-1]:
+            if self.latency:
+                time.sleep(self.latency / (len(chunks) - 1))
+            self.num_chunks += 1
+            yield chunk
+        yield chunks[-1]
+
+    async def astream(self, request: dict):
+        self.num_requests += 1
+        chunks = self.chunks(request)
+        for chunk in chunks[:-1]:
+            if self.latency:
+                await asyncio.sleep(self.latency / (len(chunks) - 1))
+            self.num_chunks += 1
+            yield chunk
+        yield chunks[-1]
+
+class ReplayBackend(MockBackend):
+    # Serves recorded responses, either from the response cache of earlier
+    # runs (looked up by the full request, tool calls included) or from a
+    # prompt -> response dict.
+    def __init__(self, responses: dict = None, cache_path: str = None, latency: float = 0.0):
+        super().__init__(None, latency)
+        self.responses = responses or {}
+        self.cache = ResponseCache(cache_path) if cache_path else None
+
+    @classmethod
+    def from_solution_files(cls, paths: List[str], prompt_key: str = "prompt_5shot",
+                            response_key: str = "pred_5shot_pro", latency: float = 0.0):
+        # Index the responses stored in output/*solution*.json by their prompt
+        responses = {}
+        for path in paths:
+            with open(path, "r") as f:
+                data = json.load(f)
+            for d in data.values():
+                if prompt_key in d and response_key in d:
+                    responses[d[prompt_key]] = d[response_key]
+        return cls(responses, latency=latency)
+
+    def completion(self, request: dict) -> ChatCompletion:
+        if self.cache is not None:
+            cached = self.cache.get(ResponseCache.make_key(request))
+            if cached is not None:
+                return ChatCompletion.model_validate_json(cached)
+        return super().completion(request)
+
+    def respond(self, request: dict) -> str:
+        prompt = request["messages"][-1]["content"]
+        if prompt in self.responses:
+            return self.responses[prompt]
+        raise KeyError("No recorded response for request")
+
+class _MockCompletions:
+    def __init__(self, backend: MockBackend):
+        self.backend = backend
+
+    def create(self, **kwargs):
+        if kwargs.get("stream"):
+            return self.backend.stream(kwargs)
+        return self.backend.complete(kwargs)
+
+class _AsyncMockCompletions(_MockCompletions):
+    async def create(self, **kwargs):
+        if kwargs.get("stream"):
+            return self.backend.astream(kwargs)
+        return await self.backend.acomplete(kwargs)
+
+class MockClient:
+    def __init__(self, backend: MockBackend, async_client: bool = False):
+        self.backend = backend
+        if async_client:
+            self.chat = _Chat(_AsyncMockCompletions(backend))
+        else:
+            self.chat = _Chat(_MockCompletions(backend))
+
+def get_client(api_key: str = None, async_client: bool = False,
+               cache_path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES,
+               backend: MockBackend = None, tokens_per_minute: int = None):
+    # Offline backends bypass the response cache so synthetic responses never
+    # end up being replayed as real ones
+    if backend is None and os.environ.get("LLMPC_BACKEND") == "replay":
+        backend = ReplayBackend(cache_path=cache_path)
+    if backend is not None:
+        return MockClient(backend, async_client)
+
+    if api_key is None:
+        api_key = os.getenv("OPENAI_KEY")
+    client = AsyncOpenAI(api_key=api_key) if async_client else OpenAI(api_key=api_key)
+    cache = ResponseCache(cache_path, max_entries) if cache_path else None
+    rate_limiter = TokenRateLimiter(tokens_per_minute) if tokens_per_minute else None
+    return CachedClient(client, cache, rate_limiter)
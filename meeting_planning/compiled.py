@@ -0,0 +1,176 @@
+import numpy as np
+from evaluate_meeting_planning_llmpc import process_constraints, convert_to_minutes
+
+# Dense form of a meeting planning example for vectorized scoring and search.
+# Locations and people are mapped to indices, travel times are an (L, L) int
+# matrix with -1 for pairs missing from dist_matrix.
+#
+# Scalar validators keep the nested dict lookups: in pure Python a dict
+# lookup is as fast as indexing, array indexing only pays off when many plans
+# or states are processed at once.
+
+# Step codes of encoded plans
+START, TRAVEL, WAIT, MEET, INVALID, RAISE = range(6)
+
+class CompiledExample:
+    def __init__(self, constraints, dist_matrix):
+        """constraints is the example's constraints list, dist_matrix either
+        the nested dict of the dataset or a (locations, matrix) pair as
+        returned by dataset_store ExampleView.dist_array()."""
+        self.start_location, initial_time = constraints[0]
+        self.start_time = convert_to_minutes(initial_time)
+        self.processed = process_constraints(constraints[1:])
+
+        if isinstance(dist_matrix, tuple):
+            locations, dist = dist_matrix
+            self.locations = list(locations)
+            self.dist = np.asarray(dist, dtype=np.int64)
+        else:
+            self.locations = list(dist_matrix.keys())
+            for row in dist_matrix.values():
+                for loc in row:
+                    if loc not in self.locations:
+                        self.locations.append(loc)
+            index = {loc: i for i, loc in enumerate(self.locations)}
+            self.dist = np.full((len(self.locations), len(self.locations)), -1, dtype=np.int64)
+            for a, row in dist_matrix.items():
+                for b, minutes in row.items():
+                    self.dist[index[a], index[b]] = minutes
+
+        # Locations only named in the constraints get rows without distances
+        extra = [loc for loc in [self.start_location] + [c["location"] for c in self.processed.values()]
+                 if loc not in self.locations]
+        for loc in dict.fromkeys(extra):
+            self.locations.append(loc)
+        self.dist = np.pad(self.dist, (0, len(self.locations) - len(self.dist)), constant_values=-1)
+        self.location_index = {loc: i for i, loc in enumerate(self.locations)}
+
+        self.people = list(self.processed.keys())
+        self.person_index = {p: i for i, p in enumerate(self.people)}
+        self.person_location = np.array([self.location_index[self.processed[p]["location"]] for p in self.people], dtype=np.int64)
+        self.window_start = np.array([self.processed[p]["start_time"] for p in self.people], dtype=np.int64)
+        self.window_end = np.array([self.processed[p]["end_time"] for p in self.people], dtype=np.int64)
+        self.meeting_time = np.array([self.processed[p]["meeting_time"] for p in self.people], dtype=np.int64)
+        # Encoded steps, the first entry pads plans of different lengths
+        self.step_ids = {}
+        self.step_table = [(START, 0, 0)]
+
+    def encode_step(self, step):
+        # (code, index, minutes) parsed like validator_from_text, RAISE marks
+        # steps on which it raises something else than a ValueError
+        try:
+            if step.startswith("You start"):
+                return START, 0, 0
+            elif step.startswith("You travel"):
+                destination = step.split("travel to ")[1].split(" in")[0].strip()
+                return TRAVEL, self.location_index.get(destination, -1), 0
+            elif step.startswith("You wait"):
+                raw_end_time = step.split("wait until ")[1].split(".")[0].strip()
+                try:
+                    return WAIT, 0, convert_to_minutes(raw_end_time)
+                except ValueError:
+                    return INVALID, 0, 0
+            elif step.startswith("You meet"):
+                person = step.split("meet ")[1].split(" for")[0].strip()
+                return MEET, self.person_index.get(person, -1), 0
+            return INVALID, 0, 0
+        except IndexError:
+            return RAISE, 0, 0
+
+    def encode_plans(self, plans):
+        # (P, S) arrays of step codes, indices and minutes, padded with START.
+        # Candidates repeat most steps, so every distinct step is encoded once
+        # and plans are gathered from the table of encoded steps.
+        width = max((len(plan) for plan in plans), default=0)
+        ids = []
+        for plan in plans:
+            row = []
+            for step in plan:
+                if step not in self.step_ids:
+                    self.step_ids[step] = len(self.step_table)
+                    self.step_table.append(self.encode_step(step))
+                row.append(self.step_ids[step])
+            ids.append(row + [0] * (width - len(row)))
+        encoded = np.array(self.step_table, dtype=np.int64)[np.array(ids, dtype=np.int64).reshape(len(plans), width)]
+        return encoded[:, :, 0], encoded[:, :, 1], encoded[:, :, 2]
+
+    def travel_matrix(self):
+        # (n + 1, n) travel times from each person's location, and from the
+        # start location in the last row, to each person's location. Staying
+        # at the same location is free, missing pairs are -1.
+        sources = np.append(self.person_location, self.location_index[self.start_location])
+        travel = self.dist[sources[:, None], self.person_location[None, :]]
+        travel[sources[:, None] == self.person_location[None, :]] = 0
+        return travel
+
+def compile_example(d):
+    # Compile a dataset example, using the dense matrix of a dataset_store
+    # view when available
+    if hasattr(d, "dist_array"):
+        return CompiledExample(d["constraints"], d.dist_array())
+    return CompiledExample(d["constraints"], d["dist_matrix"])
+
+def score_plans(plans, compiled):
+    """Score many parsed plans against one example at once.
+
+    Returns an int array with the validator_from_text score of every plan,
+    or -1 where validator_from_text raises (unknown location or person, or
+    a malformed step).
+    """
+    codes, indices, minutes = compiled.encode_plans(plans)
+    num_plans = len(plans)
+    rows = np.arange(num_plans)
+
+    cur_location = np.full(num_plans, compiled.location_index[compiled.start_location])
+    cur_time = np.full(num_plans, compiled.start_time)
+    met = np.zeros((num_plans, len(compiled.people)), dtype=bool)
+    scores = np.zeros(num_plans, dtype=np.int64)
+    alive = np.ones(num_plans, dtype=bool)
+    raised = np.zeros(num_plans, dtype=bool)
+
+    for s in range(codes.shape[1]):
+        if not alive.any():
+            break
+        code, index, time = codes[:, s], indices[:, s], minutes[:, s]
+
+        m = alive & (code == TRAVEL)
+        if m.any():
+            # Other steps hold person indices, only gather travel rows
+            known = m & (index >= 0)
+            travel = np.where(known, compiled.dist[cur_location, np.where(known, index, 0)], -1)
+            fail = m & (travel < 0)
+            raised |= fail
+            alive &= ~fail
+            m &= ~fail
+            cur_time = np.where(m, cur_time + travel, cur_time)
+            cur_location = np.where(m, index, cur_location)
+
+        m = alive & (code == WAIT)
+        if m.any():
+            backwards = m & (time <= cur_time)
+            alive &= ~backwards
+            cur_time = np.where(m & ~backwards, time, cur_time)
+
+        m = alive & (code == MEET)
+        if m.any():
+            unknown = m & (index < 0)
+            person = np.where(m & ~unknown, index, 0)
+            again = m & ~unknown & met[rows, person]
+            raised |= unknown
+            alive &= ~(again | unknown)
+            m &= ~(again | unknown)
+
+        if m.any():
+            new_time = cur_time + compiled.meeting_time[person]
+            ok = m & (cur_location == compiled.person_location[person]) \
+                & (cur_time >= compiled.window_start[person]) & (new_time <= compiled.window_end[person])
+            met[rows[m], person[m]] = True
+            scores += ok
+            cur_time = np.where(ok, new_time, cur_time)
+            alive &= ~(m & ~ok)
+
+        raised |= alive & (code == RAISE)
+        alive &= (code != INVALID) & (code != RAISE)
+
+    scores[raised] = -1
+    return scores
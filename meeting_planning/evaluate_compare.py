@@ -0,0 +1,193 @@
+"""Comparative eval script for Meeting Planning.
+
+Evaluates several solution files against the same dataset in one run, e.g.
+
+  python evaluate_compare.py --solution_paths=output/solution.json,output/llmpc_solution_multi_5_9.json
+
+The dataset fields (constraints, distances, golden plans) are loaded and
+scored once, the files are evaluated in parallel worker processes and the
+accuracy is reported per number of people and per file. Scores are the same
+as in evaluate_meeting_planning_llmpc.py.
+"""
+
+import concurrent.futures
+import contextlib
+import io
+import json
+import math
+import os
+import sys
+from typing import Any, Sequence
+
+from absl import app
+from absl import flags
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import dataset_store
+from evaluate_meeting_planning_llmpc import parse_text_plan
+from evaluate_meeting_planning_llmpc import process_constraints
+from evaluate_meeting_planning_llmpc import validator_from_text
+
+
+_SOLUTION_PATHS = flags.DEFINE_list(
+    "solution_paths",
+    ["output/solution.json"],
+    "comma separated paths to the solution files to compare.",
+)
+
+_DATASET_PATH = flags.DEFINE_string(
+    "dataset_path",
+    None,
+    "file with the shared dataset fields, json or converted with"
+    " dataset_store.py, defaults to the first solution file.",
+)
+
+_RESPONSE_KEY = flags.DEFINE_string(
+    "response_key",
+    "pred_5shot_pro",
+    "key of the model response in each example.",
+)
+
+_MAX_WORKERS = flags.DEFINE_integer(
+    "max_workers", None, "number of worker processes."
+)
+
+_OUTPUT_PATH = flags.DEFINE_string(
+    "output_path", None, "optional CSV path for the per-example scores."
+)
+
+
+# Dataset of the worker process, set once by _init_worker
+_dataset = {}
+
+
+def load_dataset(path: str) -> dict[str, Any]:
+  """Load the fields shared by all solution files, keyed by example."""
+  data = dataset_store.load_dataset(path)
+
+  dataset = {}
+  for k, obj in data.items():
+    start_location, initial_time = obj["constraints"][0]
+    dataset[k] = {
+        "num_people": obj["num_people"],
+        "start_location": start_location,
+        "initial_time": initial_time,
+        "constraints": dict(process_constraints(obj["constraints"][1:])),
+        "dist_matrix": obj["dist_matrix"],
+        "golden_plan": obj["golden_plan"],
+    }
+  return dataset
+
+
+def score_plan(example: dict[str, Any], plan: list[str]) -> int:
+  """Number of valid meetings in a parsed plan, without the error logs."""
+  with contextlib.redirect_stdout(io.StringIO()):
+    return validator_from_text(
+        plan,
+        example["constraints"],
+        example["start_location"],
+        example["initial_time"],
+        example["dist_matrix"],
+    )
+
+
+def golden_scores(dataset: dict[str, Any]) -> dict[str, int]:
+  """Score of the golden plan of every example, computed once per run."""
+  return {k: score_plan(ex, ex["golden_plan"]) for k, ex in dataset.items()}
+
+
+def _init_worker(dataset: dict[str, Any]) -> None:
+  global _dataset
+  _dataset = dataset
+
+
+def evaluate_file(path: str, response_key: str) -> dict[str, int]:
+  """Score the responses of one solution file on the worker's dataset."""
+  with open(path) as f:
+    data = json.load(f)
+
+  scores = {}
+  for k, obj in data.items():
+    if k not in _dataset or response_key not in obj:
+      continue
+    try:
+      scores[k] = score_plan(_dataset[k], parse_text_plan(obj[response_key]))
+    except:
+      scores[k] = 0
+  return scores
+
+
+def compare(
+    paths: list[str],
+    dataset: dict[str, Any],
+    response_key: str = "pred_5shot_pro",
+    max_workers: int = None,
+) -> pd.DataFrame:
+  """Evaluate the solution files in a process pool.
+
+  Args:
+    paths: Paths to solution files in json format.
+    dataset: Shared fields returned by load_dataset.
+    response_key: Key of the model response in each example.
+    max_workers: Number of worker processes, by default one per CPU.
+
+  Returns:
+    DataFrame with one row per (file, example) and columns file,
+    example_id, num_people, score, golden_score and correct. Examples
+    missing from a file are left out.
+  """
+  golden = golden_scores(dataset)
+
+  with concurrent.futures.ProcessPoolExecutor(
+      max_workers=max_workers, initializer=_init_worker, initargs=(dataset,)
+  ) as executor:
+    futures = [executor.submit(evaluate_file, p, response_key) for p in paths]
+    results = [future.result() for future in futures]
+
+  rows = []
+  for path, scores in zip(paths, results):
+    for k, score in scores.items():
+      rows.append({
+          "file": path,
+          "example_id": k,
+          "num_people": dataset[k]["num_people"],
+          "score": score,
+          "golden_score": golden[k],
+          "correct": score == golden[k],
+      })
+  return pd.DataFrame(rows)
+
+
+def accuracy_matrix(df: pd.DataFrame) -> pd.DataFrame:
+  """Accuracy per number of people (rows) and solution file (columns)."""
+  table = df.pivot_table(
+      index="num_people", columns="file", values="correct", aggfunc="mean"
+  )
+  table.loc["all"] = df.groupby("file")["correct"].mean()
+  return table[df["file"].unique()]
+
+
+def main(argv: Sequence[str]) -> None:
+  if len(argv) > 1:
+    raise app.UsageError("Too many command-line arguments.")
+
+  paths = _SOLUTION_PATHS.value
+  dataset = load_dataset(_DATASET_PATH.value or paths[0])
+  df = compare(paths, dataset, _RESPONSE_KEY.value, _MAX_WORKERS.value)
+
+  counts = df.groupby("file").size()
+  for path in paths:
+    print(f"{path}: {counts.get(path, 0)}/{len(dataset)} examples")
+  print(
+      accuracy_matrix(df).to_string(
+          float_format=lambda x: "-" if math.isnan(x) else f"{x:.4f}"
+      )
+  )
+
+  if _OUTPUT_PATH.value:
+    df.to_csv(_OUTPUT_PATH.value, index=False)
+
+
+if __name__ == "__main__":
+  app.run(main)
@@ -16,6 +16,7 @@
 
 import collections
 import datetime
+import functools
 import json
 from typing import Any, Sequence
 
@@ -34,97 +35,122 @@ MAX_CONSTRAINTS = 10
 NUM_SAMPLES_PER_CONSTRAINTS = 20
 
 
+@functools.lru_cache(maxsize=4096)
 def convert_to_time_obj(time_str: str):
   return datetime.datetime.strptime(time_str, "%I:%M%p")
 
 
+@functools.lru_cache(maxsize=4096)
+def convert_to_minutes(time_str: str) -> int:
+  """Convert a time string like 9:00AM to minutes since midnight."""
+  time_obj = convert_to_time_obj(time_str)
+  return time_obj.hour * 60 + time_obj.minute
+
+
+def format_minutes(minutes: int) -> str:
+  """Format minutes since midnight like strftime("%I:%M%p")."""
+  hour = (minutes // 60) % 24
+  return "{:02d}:{:02d}{}".format(
+      (hour - 1) % 12 + 1, minutes % 60, "AM" if hour < 12 else "PM"
+  )
+
+
 def process_constraints(data: tuple[Any, ...]):
+  """Compile the constraints, with times as integer minutes since midnight."""
   contraints = collections.defaultdict(dict)
   for name, location, times, meeting_time in data:
     contraints[name]["location"] = location
 
-    start_time = convert_to_time_obj(times.split("to")[0].strip())
-    end_time = convert_to_time_obj(times.split("to")[1].strip())
+    start_time = convert_to_minutes(times.split("to")[0].strip())
+    end_time = convert_to_minutes(times.split("to")[1].strip())
     contraints[name]["start_time"] = start_time
     contraints[name]["end_time"] = end_time
     contraints[name]["meeting_time"] = meeting_time
   return contraints
 
-def validate_constraints(
-    plan: list[str],
+def validation_step(
+    state: tuple[Any, ...],
+    step: str,
     processed_constraints: dict[str, Any],
-    start_location: str,
-    initial_time: str,
     dist_matrix: dict[str, Any],
 ):
-    """Check and report which constraints were violated in the meeting plan."""
-    violations = []
-    met_with = {}
+    """Apply one plan step to the simulator state and return the new state.
+
+    The state is (cur_location, cur_time, met_with, violations) and is never
+    modified in place, so earlier states can be shared between plans.
+    """
+    cur_location, cur_time, met_with, violations = state
+    violations = list(violations)
+
+    try:
+        if step.startswith("You start"):
+            pass
+        elif step.startswith("You travel"):
+            destination = step.split("travel to ")[1].split(" in")[0].strip()
+            travel_time = dist_matrix[cur_location][destination]
+            cur_time = cur_time + travel_time
+            cur_location = destination
+            
+        elif step.startswith("You wait"):
+            raw_end_time = step.split("wait until ")[1].split(".")[0].strip()
+            end_time = convert_to_minutes(raw_end_time)
+
+            if end_time <= cur_time:
+                violations.append(f"Invalid wait time: Cannot wait until {raw_end_time} when current time is {format_minutes(cur_time)}")
+                return cur_location, cur_time, met_with, violations
+
+            cur_time = end_time
+            
+        elif step.startswith("You meet"):
+            person = step.split("meet ")[1].split(" for")[0].strip()
+            meeting_duration = int(step.split(" for ")[1].split(" minutes")[0].strip())
+            
+            if person in met_with:
+                violations.append(f"Double booking: Attempted to meet {person} twice")
+                return cur_location, cur_time, met_with, violations
+
+            met_with = dict(met_with)
+            met_with[person] = 1
+            new_time = cur_time + meeting_duration
+
+            # Check meeting duration constraint
+            if meeting_duration != processed_constraints[person]["meeting_time"]:
+                violations.append(
+                    f"Incorrect meeting duration for {person}: Meeting scheduled for {meeting_duration} minutes but should be {processed_constraints[person]['meeting_time']} minutes"
+                )
+
+            # Check location constraint
+            if cur_location != processed_constraints[person]["location"]:
+                violations.append(
+                    f"Location mismatch for {person}: Meeting at {cur_location} but should be at {processed_constraints[person]['location']}"
+                )
+
+            # Check time window constraints
+            if cur_time < processed_constraints[person]["start_time"]:
+                violations.append(
+                    f"Too early for {person}: Meeting starts at {format_minutes(cur_time)} but available from {format_minutes(processed_constraints[person]['start_time'])}"
+                )
+            
+            if new_time > processed_constraints[person]["end_time"]:
+                violations.append(
+                    f"Too late for {person}: Meeting ends at {format_minutes(new_time)} but must end by {format_minutes(processed_constraints[person]['end_time'])}"
+                )
+
+            if not violations:  # Only update time if meeting was valid
+                cur_time = new_time
+        else:
+            violations.append(f"Unknown step format: {step}")
+
+    except Exception as e:
+        violations.append(f"Error processing step '{step}': {str(e)}")
+
+    return cur_location, cur_time, met_with, violations
 
-    cur_location = start_location
-    cur_time = convert_to_time_obj(initial_time)
-    
-    for step in plan:
-        try:
-            if step.startswith("You start"):
-                continue
-            elif step.startswith("You travel"):
-                destination = step.split("travel to ")[1].split(" in")[0].strip()
-                travel_time = dist_matrix[cur_location][destination]
-                cur_time = cur_time + datetime.timedelta(minutes=travel_time)
-                cur_location = destination
-                
-            elif step.startswith("You wait"):
-                raw_end_time = step.split("wait until ")[1].split(".")[0].strip()
-                end_time = convert_to_time_obj(raw_end_time)
-
-                if end_time <= cur_time:
-                    violations.append(f"Invalid wait time: Cannot wait until {raw_end_time} when current time is {cur_time.strftime('%I:%M%p')}")
-                    continue
-
-                cur_time = end_time
-                
-            elif step.startswith("You meet"):
-                person = step.split("meet ")[1].split(" for")[0].strip()
-                meeting_duration = int(step.split(" for ")[1].split(" minutes")[0].strip())
-                
-                if person in met_with:
-                    violations.append(f"Double booking: Attempted to meet {person} twice")
-                    continue
-
-                met_with[person] = 1
-                new_time = cur_time + datetime.timedelta(minutes=meeting_duration)
-
-                # Check meeting duration constraint
-                if meeting_duration != processed_constraints[person]["meeting_time"]:
-                    violations.append(
-                        f"Incorrect meeting duration for {person}: Meeting scheduled for {meeting_duration} minutes but should be {processed_constraints[person]['meeting_time']} minutes"
-                    )
-
-                # Check location constraint
-                if cur_location != processed_constraints[person]["location"]:
-                    violations.append(
-                        f"Location mismatch for {person}: Meeting at {cur_location} but should be at {processed_constraints[person]['location']}"
-                    )
-
-                # Check time window constraints
-                if cur_time < processed_constraints[person]["start_time"]:
-                    violations.append(
-                        f"Too early for {person}: Meeting starts at {cur_time.strftime('%I:%M%p')} but available from {processed_constraints[person]['start_time'].strftime('%I:%M%p')}"
-                    )
-                
-                if new_time > processed_constraints[person]["end_time"]:
-                    violations.append(
-                        f"Too late for {person}: Meeting ends at {new_time.strftime('%I:%M%p')} but must end by {processed_constraints[person]['end_time'].strftime('%I:%M%p')}"
-                    )
-
-                if not violations:  # Only update time if meeting was valid
-                    cur_time = new_time
-            else:
-                violations.append(f"Unknown step format: {step}")
 
-        except Exception as e:
-            violations.append(f"Error processing step '{step}': {str(e)}")
+def final_violations(state: tuple[Any, ...], processed_constraints: dict[str, Any]):
+    """Violations of a finished plan: the step violations plus unmet people."""
+    _, _, met_with, violations = state
+    violations = list(violations)
 
     # Check for people we didn't meet
     unmet_people = set(processed_constraints.keys()) - set(met_with.keys())
@@ -133,6 +159,57 @@ def validate_constraints(
 
     return violations
 
+
+def validate_constraints(
+    plan: list[str],
+    processed_constraints: dict[str, Any],
+    start_location: str,
+    initial_time: str,
+    dist_matrix: dict[str, Any],
+):
+    """Check and report which constraints were violated in the meeting plan."""
+    state = (start_location, convert_to_minutes(initial_time), {}, [])
+    for step in plan:
+        state = validation_step(state, step, processed_constraints, dist_matrix)
+    return final_violations(state, processed_constraints)
+
+
+class PrefixValidator:
+    """Validate many plans for one example, simulating shared prefixes once.
+
+    Simulator states are stored in a trie keyed by plan steps, so candidates
+    that start with the same steps, within an iteration or across
+    iterations, only pay for the steps where they differ.
+    """
+
+    def __init__(
+        self,
+        processed_constraints: dict[str, Any],
+        start_location: str,
+        initial_time: str,
+        dist_matrix: dict[str, Any],
+    ):
+        self.processed_constraints = processed_constraints
+        self.dist_matrix = dist_matrix
+        # Trie node: (children keyed by step, state after the step)
+        self.root = ({}, (start_location, convert_to_minutes(initial_time), {}, []))
+        self.steps_simulated = 0
+        self.steps_reused = 0
+
+    def validate(self, plan: list[str]):
+        """Same result as validate_constraints for this example."""
+        children, state = self.root
+        for step in plan:
+            node = children.get(step)
+            if node is None:
+                node = ({}, validation_step(state, step, self.processed_constraints, self.dist_matrix))
+                children[step] = node
+                self.steps_simulated += 1
+            else:
+                self.steps_reused += 1
+            children, state = node
+        return final_violations(state, self.processed_constraints)
+
 def validator_from_text(
     plan: list[str],
     processed_constraints: dict[str, Any],
@@ -154,22 +231,20 @@ def validator_from_text(
 
   score = 0
   cur_location = start_location
-  cur_time = convert_to_time_obj(initial_time)
+  cur_time = convert_to_minutes(initial_time)
   for step in plan:
     try:
       if step.startswith("You start"):
         continue
       elif step.startswith("You travel"):
         destination = step.split("travel to ")[1].split(" in")[0].strip()
-        cur_time = cur_time + datetime.timedelta(
-            minutes=dist_matrix[cur_location][destination]
-        )
+        cur_time = cur_time + dist_matrix[cur_location][destination]
 
         cur_location = destination
       elif step.startswith("You wait"):
 
         raw_end_time = step.split("wait until ")[1].split(".")[0].strip()
-        end_time = convert_to_time_obj(raw_end_time)
+        end_time = convert_to_minutes(raw_end_time)
 
         if end_time <= cur_time:
           raise ValueError("Cannot go backwards in time")
@@ -186,9 +261,7 @@ def validator_from_text(
           )
 
         met_with[person] = 1
-        new_time = cur_time + datetime.timedelta(
-            minutes=processed_constraints[person]["meeting_time"]
-        )
+        new_time = cur_time + processed_constraints[person]["meeting_time"]
 
         if (
             cur_location == processed_constraints[person]["location"]
@@ -259,18 +332,16 @@ def validator_from_dict(
 
   score = 0
   cur_location = start_location
-  cur_time = convert_to_time_obj(initial_time)
+  cur_time = convert_to_minutes(initial_time)
   for step in plan[1:]:
     try:
       raw_start_time = step["start_time"]
       location = step["location"]
       if location and location != cur_location:
-        cur_time = cur_time + datetime.timedelta(
-            minutes=dist_matrix[cur_location][location]
-        )
+        cur_time = cur_time + dist_matrix[cur_location][location]
         cur_location = location
 
-      start_time = convert_to_time_obj(raw_start_time)
+      start_time = convert_to_minutes(raw_start_time)
       if start_time < cur_time:
         raise ValueError("Start time too early")
       cur_time = start_time
@@ -285,9 +356,7 @@ def validator_from_dict(
         )
 
       met_with[person] = 1
-      new_time = cur_time + datetime.timedelta(
-          minutes=processed_constraints[person]["meeting_time"]
-      )
+      new_time = cur_time + processed_constraints[person]["meeting_time"]
 
       if (
           cur_location == processed_constraints[person]["location"]
@@ -1,7 +1,15 @@
 import os
-from openai import OpenAI
+import sys
 import json
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from llm_client import get_client
+from checkpoint import load_checkpoint, append_checkpoint
+from dataset_store import load_dataset
+from mock_llm import mock_backend
 from evaluate_meeting_planning_llmpc import process_constraints, parse_text_plan, validate_constraints
+from solver import solve_compiled
+from compiled import compile_example, score_plans
 
 system_prompt = """
 You are an expert meeting planner assistant. Your goal is to create and refine plans to meet friends at different places in the city, taking into account travel times and meeting time constraints.
@@ -153,22 +161,50 @@ Your current meeting plan is:
 NUM_PLANNING_STEPS = 15  
 SEED = 42
 
+# Offline mock LLM returning golden plans with injected errors after
+# MOCK_LATENCY seconds, for benchmarking without API access
+MOCK_LLM = False
+MOCK_LATENCY = 1.0
+
+# Examples processed concurrently and the token per minute budget shared by
+# all of them (None for no limit)
+MAX_IN_FLIGHT = 8
+TOKENS_PER_MINUTE = None
+
+# Skip examples already completed in the checkpoint of a previous run
+RESUME = True
+
+# Stop once a plan meets the optimal number of friends computed by the exact
+# solver, even if not everyone can be met
+EARLY_STOP = True
+
 # Clean and recreate output directory
 output_dir = "./output/llmpc"
 if not os.path.exists(output_dir):
     os.makedirs(output_dir)
 
-# Load trip planning data
-with open("/home/gabriel/projects/llmpc/meeting_planning/data/meeting_planning_reduced.json", 'r') as f:
-    data = json.load(f)
+# Load meeting planning data, a .arrow file converted with dataset_store.py
+# is loaded lazily instead
+data = load_dataset("/home/gabriel/projects/llmpc/meeting_planning/data/meeting_planning_reduced.json")
 
-client = OpenAI(api_key=os.getenv("OPENAI_KEY"))
-solutions = {}
+# Fields kept in the solutions next to the prediction. The prompt indexes the
+# responses of ReplayBackend.from_solution_files
+SOLUTION_FIELDS = ["num_people", "constraints", "dist_matrix", "golden_plan", "prompt_5shot"]
+
+if MOCK_LLM:
+    client = get_client(backend=mock_backend(data, latency=MOCK_LATENCY))
+else:
+    client = get_client(os.getenv("OPENAI_KEY"), tokens_per_minute=TOKENS_PER_MINUTE)
 
-# Run planner for each test example
-for k, d in list(data.items()):
-#k = "meeting_planning_example_394"
-#d = data[k]
+# Finished examples are appended to the checkpoint as they complete
+checkpoint_path = f"./output/llmpc_solution_{NUM_PLANNING_STEPS}.jsonl"
+if not RESUME and os.path.exists(checkpoint_path):
+    os.remove(checkpoint_path)
+completed = load_checkpoint(checkpoint_path)
+print(f"Resuming with {len(completed)} completed examples")
+
+def run_example(k, d):
+    # Run the planning loop for one example, logging to its own file
     print(f"\nProcessing example {k}")
 
     output_log = f"{output_dir}/plan_{k}.md"
@@ -180,11 +216,13 @@ for k, d in list(data.items()):
     start_location, initial_time = d["constraints"][0]
     constraints = process_constraints(d["constraints"][1:])
     dist_matrix = d["dist_matrix"]
+    compiled = compile_example(d)
+    max_meetings, _ = solve_compiled(compiled)
 
     feedback_string = ""
     # Run iterations of planning
     for iteration in range(NUM_PLANNING_STEPS):
-        print(f"\nIteration {iteration + 1}")
+        print(f"\n{k} iteration {iteration + 1}")
         
         prompt = instruction_prompt.format(
             step=iteration+1,
@@ -221,13 +259,32 @@ for k, d in list(data.items()):
                 feedback_string = "Here is feedback on the plan:\n" + "\n* ".join(failed_constraints)
 
             if len(failed_constraints)==0:
-                print("all constraints met exiting")
+                print(f"{k}: all constraints met exiting")
+                break
+
+            # score_plans gives -1 where validator_from_text raises, e.g. on an
+            # unknown location or person
+            if EARLY_STOP and score_plans([parsed_plan], compiled)[0] == max_meetings:
+                print(f"{k}: optimal number of meetings ({max_meetings}) reached exiting")
                 break
         else:
             current_plan = content.strip()
 
-    solutions[k] = d
-    solutions[k]['pred_5shot_pro'] = content
+    append_checkpoint(checkpoint_path, k, {'pred_5shot_pro': content})
+    return content
+
+# Run planner for each test example concurrently
+with ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT) as executor:
+    futures = {k: executor.submit(run_example, k, d) for k, d in data.items() if k not in completed}
+
+# Merge solutions in dataset order
+solutions = {}
+for k, d in data.items():
+    solutions[k] = {field: d[field] for field in SOLUTION_FIELDS}
+    if k in completed:
+        solutions[k]['pred_5shot_pro'] = completed[k]['pred_5shot_pro']
+    else:
+        solutions[k]['pred_5shot_pro'] = futures[k].result()
 
 # Save solutions
 with open(f"./output/llmpc_solution_{NUM_PLANNING_STEPS}.json", 'w') as f:
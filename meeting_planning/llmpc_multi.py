@@ -1,7 +1,14 @@
 import os
-from openai import OpenAI
+import sys
 import json
-from evaluate_meeting_planning_llmpc import process_constraints, parse_text_plan, validate_constraints
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from llm_client import get_client, stream_content
+from checkpoint import load_checkpoint, append_checkpoint
+from dataset_store import load_dataset
+from mock_llm import mock_backend
+from evaluate_meeting_planning_llmpc import process_constraints, parse_text_plan, PrefixValidator
+from solver import solve_compiled
+from compiled import compile_example, score_plans
 
 PLANS_PER_ITERATION = 5
 
@@ -128,23 +135,78 @@ NUM_PLANNING_STEPS = 9
 
 SEED = 42
 
+# Offline mock LLM returning golden plans with injected errors after
+# MOCK_LATENCY seconds, for benchmarking without API access
+MOCK_LLM = False
+MOCK_LATENCY = 1.0
+
+# Stream the response and validate each plan as soon as its '---' delimiter
+# arrives, closing the stream once a plan meets all constraints. Closed
+# streams are not cached, reruns request them again.
+STREAM = True
+
+# Skip examples already completed in the checkpoint of a previous run
+RESUME = True
+
+# Stop once a plan meets the optimal number of friends computed by the exact
+# solver, even if not everyone can be met
+EARLY_STOP = True
+
+def stream_plans(deltas, parts):
+    # Yield the plans following 'SOLUTION:' one at a time as they complete,
+    # the raw text deltas are collected in parts
+    buffer = ""
+    started = False
+    for delta in deltas:
+        parts.append(delta)
+        buffer += delta
+        if not started:
+            if "SOLUTION:" not in buffer:
+                continue
+            buffer = buffer.split("SOLUTION:", 1)[1]
+            started = True
+        while "---" in buffer:
+            plan, buffer = buffer.split("---", 1)
+            yield plan.strip()
+    if started:
+        yield buffer.strip()
+
 # Clean and recreate output directory
 output_dir = "./output/llmpc"
 if not os.path.exists(output_dir):
     os.makedirs(output_dir)
 
-# Load trip planning data
-with open("/home/gabriel/projects/llmpc/meeting_planning/data/meeting_planning_reduced.json", 'r') as f:
-    data = json.load(f)
+# Load meeting planning data, a .arrow file converted with dataset_store.py
+# is loaded lazily instead
+data = load_dataset("/home/gabriel/projects/llmpc/meeting_planning/data/meeting_planning_reduced.json")
+
+# Fields kept in the solutions next to the prediction. The prompt indexes the
+# responses of ReplayBackend.from_solution_files
+SOLUTION_FIELDS = ["num_people", "constraints", "dist_matrix", "golden_plan", "prompt_5shot"]
 
-client = OpenAI(api_key=os.getenv("OPENAI_KEY"))
+if MOCK_LLM:
+    client = get_client(backend=mock_backend(data, latency=MOCK_LATENCY))
+else:
+    client = get_client(os.getenv("OPENAI_KEY"))
 solutions = {}
 
+# Finished examples are appended to the checkpoint as they complete
+checkpoint_path = f"./output/llmpc_solution_multi_{PLANS_PER_ITERATION}_{NUM_PLANNING_STEPS}.jsonl"
+if not RESUME and os.path.exists(checkpoint_path):
+    os.remove(checkpoint_path)
+completed = load_checkpoint(checkpoint_path)
+print(f"Resuming with {len(completed)} completed examples")
+
 
 # Run planner for each test example
 #k = "meeting_planning_example_974"
 #d = data[k]
 for k, d in list(data.items()):
+    if k in completed:
+        solutions[k] = {field: d[field] for field in SOLUTION_FIELDS}
+        solutions[k]['pred_5shot_pro'] = completed[k]['pred_5shot_pro']
+        continue
+
     print(f"\nProcessing example {k}")
 
     output_log = f"{output_dir}/plan_{k}.md"
@@ -157,6 +219,11 @@ for k, d in list(data.items()):
     start_location, initial_time = d["constraints"][0]
     constraints = process_constraints(d["constraints"][1:])
     dist_matrix = d["dist_matrix"]
+    compiled = compile_example(d)
+    max_meetings, _ = solve_compiled(compiled)
+    # Candidates share long prefixes within and across iterations, the
+    # validator keeps the simulated state of every prefix seen so far
+    validator = PrefixValidator(constraints, start_location, initial_time, dist_matrix)
 
     feedback_string = ""
     # Run iterations of planning
@@ -173,7 +240,7 @@ for k, d in list(data.items()):
             num_plans=PLANS_PER_ITERATION
         )
 
-        response = client.chat.completions.create(
+        request = dict(
             model="gpt-4o",
             messages=[{"role": "system", "content": system_prompt},
                         {"role":"user","content":prompt}],
@@ -182,30 +249,50 @@ for k, d in list(data.items()):
             seed=SEED
         )
 
-        content = response.choices[0].message.content
+        if STREAM:
+            stream = client.chat.completions.create(stream=True, **request)
+            parts = []
+            plans = stream_plans(stream_content(stream), parts)
+        else:
+            response = client.chat.completions.create(**request)
+            content = response.choices[0].message.content
+            plans = []
+            if "SOLUTION:" in content:
+                plans = content.split("SOLUTION:")[1].strip().split("---")
+                plans = [p.strip() for p in plans]
+
+        # Evaluate each plan, a plan without violations can not be beaten
+        # so the remaining ones are not needed
+        num_plans = 0
+        best_plan = None
+        best_num_failed = float('inf')
+        for plan in plans:
+            num_plans += 1
+            parsed_plan = parse_text_plan(plan)
+            print(parsed_plan)
+            failed_constraints = validator.validate(parsed_plan)
+
+            if len(failed_constraints) < best_num_failed:
+                best_num_failed = len(failed_constraints)
+                best_plan = plan
+                current_feedback = failed_constraints
+
+            if best_num_failed == 0:
+                break
+
+        if STREAM:
+            # Closing the stream stops the generation of the remaining plans
+            stream.close()
+            content = "".join(parts)
+            if best_num_failed == 0:
+                print(f"Valid plan found after {num_plans} plans, stream closed")
 
         with open(output_log, 'a') as f:
             f.write(f"\nIteration {iteration + 1}\n")
             f.write(f"{prompt}\n\n")
             f.write(f"{content}\n")
 
-        if "SOLUTION:" in content:
-            plans = content.split("SOLUTION:")[1].strip().split("---")
-            plans = [p.strip() for p in plans]
-
-            # Evaluate each plan
-            best_plan = None
-            best_num_failed = float('inf')
-            for plan in plans:
-                parsed_plan = parse_text_plan(plan)
-                print(parsed_plan)
-                failed_constraints = validate_constraints(parsed_plan, constraints, start_location, initial_time, dist_matrix)
-
-                if len(failed_constraints) < best_num_failed:
-                    best_num_failed = len(failed_constraints)
-                    best_plan = plan
-                    current_feedback = failed_constraints
-
+        if num_plans > 0:
             current_plan = best_plan
             
             if best_num_failed > 0:
@@ -213,11 +300,17 @@ for k, d in list(data.items()):
             else:
                 print("All constraints met, exiting")
                 break
+
+            if EARLY_STOP and score_plans([parse_text_plan(best_plan)], compiled)[0] == max_meetings:
+                print(f"Optimal number of meetings ({max_meetings}) reached, exiting")
+                break
         else:
             current_plan = content.strip()
 
-    solutions[k] = d
+    print(f"Validated {validator.steps_simulated} plan steps, reused {validator.steps_reused}")
+    solutions[k] = {field: d[field] for field in SOLUTION_FIELDS}
     solutions[k]['pred_5shot_pro'] = current_plan
+    append_checkpoint(checkpoint_path, k, {'pred_5shot_pro': current_plan})
 
 # Save solutions
 with open(f"./output/llmpc_solution_multi_{PLANS_PER_ITERATION}_{NUM_PLANNING_STEPS}.json", 'w') as f:
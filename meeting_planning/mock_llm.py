@@ -0,0 +1,58 @@
+import os
+import re
+import sys
+import random
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from llm_client import MockBackend
+
+# Offline stand-in for the meeting planner LLM. Answers each request with the
+# golden plan of the example whose task appears in the prompt, with errors
+# injected at a configurable rate, so the planning loops can be benchmarked
+# without API access.
+
+def golden_plan_text(golden_plan):
+    return " ".join(step.strip().rstrip(".") + "." for step in golden_plan)
+
+def inject_error(steps, rng):
+    # Corrupt one meeting: either change its duration or drop it
+    meetings = [i for i, step in enumerate(steps) if step.startswith("You meet")]
+    if not meetings:
+        return steps
+    i = rng.choice(meetings)
+    steps = list(steps)
+    if rng.random() < 0.5:
+        steps[i] = re.sub(r"for (\d+) minutes", lambda m: f"for {int(m.group(1)) + 15} minutes", steps[i], count=1)
+    else:
+        del steps[i]
+    return steps
+
+def golden_plan_responder(data, error_rate=0.3, seed=42):
+    rng = random.Random(seed)
+    examples = list(data.values())
+
+    def find_example(prompt):
+        for d in examples:
+            if d["prompt_0shot"] in prompt or d["prompt_5shot"] == prompt:
+                return d
+        raise KeyError("No example found for prompt")
+
+    def respond(request):
+        prompt = request["messages"][-1]["content"]
+        d = find_example(prompt)
+
+        # Multi plan prompts ask for N plans separated by '---'
+        num_plans = re.search(r"followed by (\d+) plans", prompt)
+        num_plans = int(num_plans.group(1)) if num_plans else 1
+
+        plans = []
+        for _ in range(num_plans):
+            steps = list(d["golden_plan"])
+            if rng.random() < error_rate:
+                steps = inject_error(steps, rng)
+            plans.append(golden_plan_text(steps))
+        return "SOLUTION:\n" + "\n---\n".join(plans)
+
+    return respond
+
+def mock_backend(data, error_rate=0.3, latency=0.0, seed=42):
+    return MockBackend(golden_plan_responder(data, error_rate, seed), latency)
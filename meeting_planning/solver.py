@@ -0,0 +1,104 @@
+import numpy as np
+from evaluate_meeting_planning_llmpc import format_minutes
+from compiled import CompiledExample
+
+# Exact solver for the meeting planning task. Finds the maximum number of
+# friends that can be met with a bitmask DP over (met set, last friend met),
+# keeping only the earliest time each state can be reached: any plan that
+# reaches the same state later can be replaced by the earlier one. Each level
+# of the DP is expanded at once on the dense travel matrix of the example.
+
+def format_time(minutes):
+    # Same format as the dataset plans, e.g. 9:00AM
+    return format_minutes(minutes).lstrip("0")
+
+def solve_meetings(constraints, dist_matrix):
+    """Return (max number of meetings, optimal plan as a list of steps).
+
+    constraints is the example's constraints list, the first entry is the
+    (start_location, initial_time) pair followed by one
+    (name, location, times, meeting_time) entry per friend. dist_matrix is
+    the nested dict of the dataset or a (locations, matrix) pair.
+    """
+    return solve_compiled(CompiledExample(constraints, dist_matrix))
+
+def solve_compiled(compiled):
+    """solve_meetings on an example already compiled to its dense form."""
+    n = len(compiled.people)
+    travel = compiled.travel_matrix()
+    bits = 1 << np.arange(n, dtype=np.int64)
+
+    # Frontier of states (mask, last) with the earliest end time of the last
+    # meeting, last == n stands for the start location before any meeting.
+    # levels[c] holds the states with c meetings and their parent index.
+    masks = np.zeros(1, dtype=np.int64)
+    lasts = np.full(1, n, dtype=np.int64)
+    ends = np.full(1, compiled.start_time, dtype=np.int64)
+    levels = [(masks, lasts, ends, np.zeros(1, dtype=np.int64))]
+
+    for count in range(n):
+        # Every unmet friend that can be met next from every state at once
+        arrive = ends[:, None] + travel[lasts]
+        start = np.maximum(arrive, compiled.window_start[None, :])
+        end = start + compiled.meeting_time[None, :]
+        ok = ((masks[:, None] & bits[None, :]) == 0) & (travel[lasts] >= 0) \
+            & (end <= compiled.window_end[None, :])
+
+        # Upper bound: friends that can still be met on their own. States
+        # that can not get past count + 1 are only kept when no state can.
+        reach = ok.sum(axis=1)
+        if not reach.any():
+            break
+        promising = reach > 1
+        if not promising.any():
+            promising = reach > 0
+        parent, friend = np.nonzero(ok & promising[:, None])
+
+        # Keep the earliest end time of each new state
+        new_masks = masks[parent] | bits[friend]
+        new_ends = end[parent, friend]
+        keys = new_masks * n + friend
+        order = np.lexsort((new_ends, keys))
+        _, first = np.unique(keys[order], return_index=True)
+        chosen = order[first]
+
+        masks, lasts, ends = new_masks[chosen], friend[chosen], new_ends[chosen]
+        levels.append((masks, lasts, ends, parent[chosen]))
+
+    # Earliest finishing state among those meeting the most friends
+    best_count = len(levels) - 1
+    i = int(np.argmin(levels[best_count][2]))
+    order = []
+    for c in range(best_count, 0, -1):
+        order.append(int(levels[c][1][i]))
+        i = int(levels[c][3][i])
+    order.reverse()
+
+    locations = [compiled.locations[loc] for loc in compiled.person_location]
+    windows = list(zip(compiled.window_start.tolist(), compiled.window_end.tolist(), compiled.meeting_time.tolist()))
+
+    def travel_time(a, b):
+        return 0 if a == b else int(compiled.dist[compiled.location_index[a], compiled.location_index[b]])
+
+    return best_count, reconstruct_plan(order, compiled.people, locations, windows,
+                                        compiled.start_location, compiled.start_time, travel_time)
+
+def reconstruct_plan(order, people, locations, windows, start_location, t0, travel):
+    plan = [f"You start at {start_location} at {format_time(t0)}"]
+    t = t0
+    loc = start_location
+    for j in order:
+        if locations[j] != loc:
+            t += travel(loc, locations[j])
+            plan.append(f"You travel to {locations[j]} in {travel(loc, locations[j])} minutes and arrive at {format_time(t)}")
+            loc = locations[j]
+        if t < windows[j][0]:
+            t = windows[j][0]
+            plan.append(f"You wait until {format_time(t)}")
+        end = t + windows[j][2]
+        plan.append(f"You meet {people[j]} for {windows[j][2]} minutes from {format_time(t)} to {format_time(end)}")
+        t = end
+    return plan
+
+def plan_text(plan):
+    return " ".join(step + "." for step in plan)
@@ -0,0 +1,55 @@
+import contextlib
+import io
+import random
+
+from evaluate_meeting_planning_llmpc import process_constraints, validator_from_text
+from compiled import CompiledExample, score_plans
+
+# More people than locations, so person indices of meeting steps exceed the
+# location indices used by travel steps
+CONSTRAINTS = [
+    ["Nob Hill", "9:00AM"],
+    ["Jessica", "Mission District", "9:00AM to 11:00AM", 30],
+    ["Karen", "Mission District", "10:00AM to 2:00PM", 45],
+    ["Paul", "Nob Hill", "12:00PM to 4:00PM", 60],
+    ["Mary", "Presidio", "1:00PM to 6:00PM", 30],
+    ["Betty", "Nob Hill", "3:00PM to 8:00PM", 75],
+]
+DIST_MATRIX = {
+    "Nob Hill": {"Mission District": 6, "Presidio": 17},
+    "Mission District": {"Nob Hill": 13, "Presidio": 25},
+    "Presidio": {"Nob Hill": 18, "Mission District": 26},
+}
+STEPS = [
+    "You travel to Mission District in 6 minutes and arrive at 9:06AM",
+    "You travel to Nob Hill in 13 minutes and arrive at 10:00AM",
+    "You travel to Presidio in 17 minutes and arrive at 1:00PM",
+    "You travel to Nowhere in 5 minutes and arrive at 1:00PM",
+    "You wait until 10:00AM",
+    "You wait until 3:00PM",
+    "You meet Jessica for 30 minutes from 9:06AM to 9:36AM",
+    "You meet Karen for 45 minutes from 10:00AM to 10:45AM",
+    "You meet Paul for 60 minutes from 12:00PM to 1:00PM",
+    "You meet Mary for 30 minutes from 1:17PM to 1:47PM",
+    "You meet Betty for 75 minutes from 3:00PM to 4:15PM",
+    "You meet Nobody for 10 minutes from 1:00PM to 1:10PM",
+    "You rest",
+]
+
+def reference_score(plan):
+    start_location, initial_time = CONSTRAINTS[0]
+    constraints = process_constraints(CONSTRAINTS[1:])
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return validator_from_text(plan, constraints, start_location, initial_time, DIST_MATRIX)
+    except (KeyError, IndexError):
+        return -1
+
+def test_score_plans_mixed_steps():
+    compiled = CompiledExample(CONSTRAINTS, DIST_MATRIX)
+    assert len(compiled.people) > len(compiled.locations)
+    rng = random.Random(0)
+    for _ in range(300):
+        plans = [["You start at Nob Hill at 9:00AM"] + rng.choices(STEPS, k=rng.randint(0, 8))
+                 for _ in range(rng.randint(2, 8))]
+        assert score_plans(plans, compiled).tolist() == [reference_score(plan) for plan in plans]
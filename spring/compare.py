@@ -1,7 +1,8 @@
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from lib import solve_mpc, simulate_sequence, get_best_llm_plan
+from concurrent.futures import ThreadPoolExecutor
+from lib import solve_mpc_batch, simulate_batch, get_best_llm_plan, use_mock_planner, mpc_cache_stats
 
 # System parameters
 m = 1.0       # mass
@@ -15,9 +16,15 @@ M = 2   # number of steps to apply before replanning
 Qx = 100.0  # state error weight for position
 Qv = 100.0   # state error weight for velocity
 Qu = 0.1   # control effort weight
+u_min = None  # control bounds, set to 0.0 and 20.0 to match the LLM prompt
+u_max = None
 
 # Number of candidate sequences from LLM
 K = 15
+# Offline mock planner returning perturbed MPC plans after MOCK_LATENCY
+# seconds, for benchmarking without API access
+MOCK_LLM = False
+MOCK_LATENCY = 0.5
 
 # Simulation parameters
 T = 50
@@ -26,25 +33,57 @@ T = 50
 x0 = 1.0
 v0 = 0.0
 
+# Parallel LLM queries for the planner sweep
+MAX_WORKERS = 8
+
+def sweep_planners(x_test, v_test, with_llm=True, max_workers=MAX_WORKERS, output_path=None):
+    # Evaluate MPC (and optionally LLM) plans for every (x, v) pair on the grid
+    # x_test x v_test. All MPC problems are solved in one batched call, LLM
+    # queries run concurrently and all plans are scored in one rollout.
+    X, V = np.meshgrid(x_test, v_test, indexing='ij')
+    xs = X.ravel()
+    vs = V.ravel()
+
+    mpc_plans = solve_mpc_batch(xs, vs, H, dt, m, k_spring, x_goal, Qx, Qv, Qu, u_min, u_max)
+    df = pd.DataFrame({'x': xs, 'v': vs})
+    df['mpc_costs'] = simulate_batch(xs, vs, mpc_plans, dt, m, k_spring, x_goal, Qx, Qv, Qu)
+
+    if with_llm:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            llm_plans = list(executor.map(
+                lambda state: get_best_llm_plan(state[0], state[1], H, K, dt, m, k_spring, x_goal, Qx, Qv, Qu),
+                zip(xs, vs)))
+        df['llm_costs'] = simulate_batch(xs, vs, llm_plans, dt, m, k_spring, x_goal, Qx, Qv, Qu)
+
+    if output_path is not None:
+        # Columnar output for large grids
+        df.to_parquet(output_path)
+
+    return df
+
+def plot_cost_landscape(df, column, path):
+    # Plot the cost of a sweep_planners result over the (x, v) grid
+    x_test = np.unique(df['x'])
+    v_test = np.unique(df['v'])
+    costs = df[column].to_numpy().reshape(len(x_test), len(v_test))
+
+    plt.figure()
+    plt.pcolormesh(v_test, x_test, costs, shading='auto')
+    plt.colorbar(label='Cost')
+    plt.xlabel('v')
+    plt.ylabel('x')
+    plt.title(f'{column} landscape')
+    plt.savefig(path)
+    plt.close()
+
 def compare_planners():
     # Grid of initial states to test
     x_test = np.linspace(0, 3, 10)
     v_test = np.linspace(-1, 1, 10)
-    
-    mpc_costs = []
-    llm_costs = []
-    
-    for x in x_test:
-        for v in v_test:
-            # Get MPC plan and cost
-            x_plan, v_plan, u_plan = solve_mpc(x, v, H, dt, m, k_spring, x_goal, Qx, Qv, Qu)
-            mpc_cost = simulate_sequence(x, v, u_plan, dt, m, k_spring, x_goal, Qx, Qv, Qu)
-            mpc_costs.append(mpc_cost)
-            
-            # Get LLM plan and cost 
-            llm_plan = get_best_llm_plan(x, v, H, K, dt, m, k_spring, x_goal, Qx, Qv, Qu)
-            llm_cost = simulate_sequence(x, v, llm_plan, dt, m, k_spring, x_goal, Qx, Qv, Qu)
-            llm_costs.append(llm_cost)
+
+    df = sweep_planners(x_test, v_test)
+    mpc_costs = df['mpc_costs']
+    llm_costs = df['llm_costs']
             
     # Plot histogram of costs
     plt.figure()
@@ -67,10 +106,19 @@ def compare_planners():
     return np.mean(mpc_costs), np.mean(llm_costs)
 
 if __name__ == "__main__":
+    if MOCK_LLM:
+        use_mock_planner(Qx, Qv, Qu, latency=MOCK_LATENCY)
+
     # Run regular simulation
     # ... existing code ...
     
+    # Dense MPC cost landscape
+    sweep = sweep_planners(np.linspace(0, 3, 200), np.linspace(-1, 1, 200), with_llm=False,
+                           output_path=f'./output/mpc_sweep_H{H}.parquet')
+    plot_cost_landscape(sweep, 'mpc_costs', f'./output/mpc_cost_landscape_H{H}.png')
+
     # Run comparison
     mpc_mean, llm_mean = compare_planners()
     print(f"Mean MPC cost: {mpc_mean}")
-    print(f"Mean LLM cost: {llm_mean}")
\ No newline at end of file
+    print(f"Mean LLM cost: {llm_mean}")
+    print(f"MPC problem cache: {mpc_cache_stats['hits']} hits, {mpc_cache_stats['misses']} misses")
\ No newline at end of file
@@ -1,8 +1,13 @@
 import numpy as np
 import cvxpy as cp
 import os
-from openai import OpenAI
+import sys
 import ast
+import re
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import llm_client
+from functools import lru_cache
 
 SEED = 42
 TEMPERATURE = 0.1
@@ -23,12 +28,107 @@ def simulate_sequence(x_init, v_init, u_sequence, dt, m, k_spring, x_goal, Qx, Q
     cost += Qx*(x - x_goal)**2 + Qv*(v**2)
     return cost
 
-def solve_mpc(x_init, v_init, H, dt, m, k_spring, x_goal, Qx, Qv, Qu):
+def simulate_batch(x_init, v_init, u_sequences, dt, m, k_spring, x_goal, Qx, Qv, Qu, return_trajectories=False):
+    # Vectorized version of simulate_sequence: rolls out N candidate control
+    # sequences (N, H) from N initial states (N,) (or a scalar state shared by
+    # all candidates) and returns the (N,) costs. With return_trajectories the
+    # (N, H+1) position and velocity trajectories are returned as well.
+    u = np.atleast_2d(np.asarray(u_sequences, dtype=float))
+    N, H = u.shape
+    x = np.broadcast_to(np.asarray(x_init, dtype=float), (N,)).copy()
+    v = np.broadcast_to(np.asarray(v_init, dtype=float), (N,)).copy()
+
+    if return_trajectories:
+        xs = np.empty((N, H+1))
+        vs = np.empty((N, H+1))
+        xs[:, 0] = x
+        vs[:, 0] = v
+
+    cost = Qu*np.sum(u**2, axis=1)
+    for i in range(H):
+        a = (u[:, i] - k_spring*x)/m
+        x = x + dt*v
+        v = v + dt*a
+        if return_trajectories:
+            xs[:, i+1] = x
+            vs[:, i+1] = v
+
+    # Add terminal cost:
+    cost += Qx*(x - x_goal)**2 + Qv*(v**2)
+    if return_trajectories:
+        return cost, xs, vs
+    return cost
+
+@lru_cache(maxsize=None)
+def condense_mpc(H, dt, m, k_spring, Qx, Qv, Qu):
+    # Condense the linear dynamics into the terminal state s_H = A^H s_0 + G u
+    # and precompute the gain of the unconstrained QP
+    #   min_u Qu*|u|^2 + (s_H - s_goal)^T W (s_H - s_goal)
+    # so that u* = gain @ (A^H s_0 - s_goal). Built once per model/horizon.
+    A = np.array([[1.0, dt],
+                  [-dt*k_spring/m, 1.0]])
+    B = np.array([0.0, dt/m])
+
+    G = np.empty((2, H))
+    for i in range(H):
+        G[:, i] = np.linalg.matrix_power(A, H-1-i) @ B
+    A_H = np.linalg.matrix_power(A, H)
+    W = np.diag([Qx, Qv])
+
+    # Hessian and the linear map from terminal error to gradient
+    P = Qu*np.eye(H) + G.T @ W @ G
+    gain = -np.linalg.solve(P, G.T @ W)
+    return A_H, gain
+
+def solve_mpc_condensed(x_init, v_init, H, dt, m, k_spring, x_goal, Qx, Qv, Qu):
+    # Closed form solution of the unconstrained MPC problem. x_init/v_init may
+    # be scalars or (N,) arrays, the returned controls are (H,) or (N, H).
+    A_H, gain = condense_mpc(H, dt, m, k_spring, Qx, Qv, Qu)
+    s0 = np.stack([np.asarray(x_init, dtype=float), np.asarray(v_init, dtype=float)])
+    s_goal = np.array([x_goal, 0.0]).reshape((2,) + (1,)*(s0.ndim-1))
+    u_plan = gain @ (A_H @ s0 - s_goal)
+    return u_plan.T
+
+def solve_mpc(x_init, v_init, H, dt, m, k_spring, x_goal, Qx, Qv, Qu, u_min=None, u_max=None):
+    # Without input bounds the problem is an unconstrained QP with a closed
+    # form solution, only fall back to cvxpy when bounds are enabled.
+    if u_min is None and u_max is None:
+        u_plan = solve_mpc_condensed(x_init, v_init, H, dt, m, k_spring, x_goal, Qx, Qv, Qu)
+        _, x_plan, v_plan = simulate_batch(x_init, v_init, u_plan[None, :], dt, m, k_spring,
+                                           x_goal, Qx, Qv, Qu, return_trajectories=True)
+        return x_plan[0], v_plan[0], u_plan
+
+    return solve_mpc_cvxpy(x_init, v_init, H, dt, m, k_spring, x_goal, Qx, Qv, Qu, u_min, u_max)
+
+def solve_mpc_batch(x_init, v_init, H, dt, m, k_spring, x_goal, Qx, Qv, Qu, u_min=None, u_max=None):
+    # Solve the MPC problem for N initial states (N,) at once and return the
+    # (N, H) control plans. Unbounded problems are a single matrix product,
+    # bounded ones reuse the cached cvxpy problem for every state.
+    x_init = np.ravel(np.asarray(x_init, dtype=float))
+    v_init = np.ravel(np.asarray(v_init, dtype=float))
+    if u_min is None and u_max is None:
+        return solve_mpc_condensed(x_init, v_init, H, dt, m, k_spring, x_goal, Qx, Qv, Qu)
+
+    u_plans = np.empty((len(x_init), H))
+    for i, (x, v) in enumerate(zip(x_init, v_init)):
+        _, _, u_plans[i] = solve_mpc_cvxpy(x, v, H, dt, m, k_spring, x_goal, Qx, Qv, Qu, u_min, u_max)
+    return u_plans
+
+# Compiled cvxpy problems keyed by horizon, model and bound parameters
+_mpc_problem_cache = {}
+mpc_cache_stats = {"hits": 0, "misses": 0}
+
+def build_mpc_problem(H, dt, m, k_spring, x_goal, Qx, Qv, Qu, u_min=None, u_max=None):
     # Variables
     x_var = cp.Variable((H+1,)) # positions
     v_var = cp.Variable((H+1,)) # velocities
     u_var = cp.Variable((H,))   # control inputs
 
+    # Initial state as parameters so the problem stays DPP compliant and
+    # can be re-solved without recompiling
+    x_init = cp.Parameter()
+    v_init = cp.Parameter()
+
     # Objective
     cost = 0
     constraints = []
@@ -47,11 +147,35 @@ def solve_mpc(x_init, v_init, H, dt, m, k_spring, x_goal, Qx, Qv, Qu):
         # v_{k+1} = v_k + (dt/m)*(u_k - k_spring*(x_k - x_0))
         constraints += [v_var[i+1] == v_var[i] + (dt/m)*(u_var[i] - k_spring*(x_var[i]))]
 
+    # Input bounds
+    if u_min is not None:
+        constraints += [u_var >= u_min]
+    if u_max is not None:
+        constraints += [u_var <= u_max]
+
     # Terminal cost (for stability)
     cost += Qx*(x_var[H] - x_goal)**2 + Qv*(v_var[H])**2
 
-    # Solve MPC
     prob = cp.Problem(cp.Minimize(cost), constraints)
+    return prob, x_init, v_init, x_var, v_var, u_var
+
+def get_mpc_problem(H, dt, m, k_spring, x_goal, Qx, Qv, Qu, u_min=None, u_max=None):
+    key = (H, dt, m, k_spring, x_goal, Qx, Qv, Qu, u_min, u_max)
+    if key in _mpc_problem_cache:
+        mpc_cache_stats["hits"] += 1
+    else:
+        mpc_cache_stats["misses"] += 1
+        _mpc_problem_cache[key] = build_mpc_problem(*key)
+    return _mpc_problem_cache[key]
+
+def solve_mpc_cvxpy(x_init, v_init, H, dt, m, k_spring, x_goal, Qx, Qv, Qu, u_min=None, u_max=None):
+    prob, x_param, v_param, x_var, v_var, u_var = get_mpc_problem(
+        H, dt, m, k_spring, x_goal, Qx, Qv, Qu, u_min, u_max)
+    x_param.value = x_init
+    v_param.value = v_init
+
+    # Solve MPC, reusing the same problem lets OSQP warm start from the
+    # previous solution
     prob.solve(solver=cp.OSQP, warm_start=True)
 
     # Extract solution
@@ -67,7 +191,64 @@ def solve_mpc(x_init, v_init, H, dt, m, k_spring, x_goal, Qx, Qv, Qu):
 
     return x_plan, v_plan, u_plan
 
-def query_llm_for_plans(x_init, v_init, H, K, dt, m, k_spring, x_goal):
+# Shared clients, created on first use and reused across planning steps
+_client = None
+_async_client = None
+_loop = None
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = llm_client.get_client(os.getenv('OPENAI_KEY'))
+    return _client
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        _async_client = llm_client.get_client(os.getenv('OPENAI_KEY'), async_client=True)
+    return _async_client
+
+def run_async(coro):
+    # Run a coroutine on a persistent event loop so the pooled async client
+    # keeps its connections between planning steps
+    global _loop
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+    return _loop.run_until_complete(coro)
+
+def use_backend(backend):
+    # Serve all planner requests from an offline llm_client backend
+    global _client, _async_client
+    _client = llm_client.get_client(backend=backend)
+    _async_client = llm_client.get_client(backend=backend, async_client=True)
+
+def mpc_plan_responder(Qx, Qv, Qu, noise=1.0, seed=SEED):
+    # Offline stand-in for the LLM planner: reads the state and parameters
+    # back from the prompt and answers with K noisy copies of the MPC plan,
+    # clipped to the 0..20 range the prompt asks for.
+    rng = np.random.default_rng(seed)
+
+    def number(name, prompt):
+        return float(re.search(rf"{name}=(-?[\d.e+-]+)", prompt).group(1))
+
+    def respond(request):
+        prompt = request["messages"][-1]["content"]
+        m, k_spring, dt = number("m", prompt), number("k_spring", prompt), number("dt", prompt)
+        x, v = number("x", prompt), number("v", prompt)
+        x_goal = number("x_goal", prompt)
+        H = int(number("H", prompt))
+        K = int(re.search(r"propose (\d+) candidate", prompt).group(1))
+
+        u_plan = solve_mpc_condensed(x, v, H, dt, m, k_spring, x_goal, Qx, Qv, Qu)
+        u_plans = np.clip(u_plan + noise*rng.standard_normal((K, H)), 0.0, 20.0)
+        return str({f"sequence_{i+1}": [round(float(u), 3) for u in u_plans[i]] for i in range(K)})
+
+    return respond
+
+def use_mock_planner(Qx, Qv, Qu, noise=1.0, latency=0.0):
+    use_backend(llm_client.MockBackend(mpc_plan_responder(Qx, Qv, Qu, noise), latency))
+
+def build_plan_prompt(x_init, v_init, H, K, dt, m, k_spring, x_goal):
     # Prompt asking for K candidate sequences
     prompt = f"""
 Given:
@@ -94,11 +275,31 @@ Given:
    }}
 Do not use ```python tags, no extra commentary, just return the dictionary.
 """
+    return prompt
+
+def parse_plans(plan_str, H, K):
+    # Parse a dictionary of K sequences of length H, raises on invalid output.
+    # Only sequence_1..sequence_K are returned, extra keys are ignored
+    plans = ast.literal_eval(plan_str)
+    # Expecting a dict with sequence_i keys
+    if not isinstance(plans, dict):
+        raise ValueError("LLM did not return a dictionary.")
+    # Check each sequence is list of length H
+    sequences = {}
+    for i in range(1, K+1):
+        seq_key = f"sequence_{i}"
+        if seq_key not in plans:
+            raise ValueError(f"Key {seq_key} not found.")
+        seq = plans[seq_key]
+        if not (isinstance(seq, list) and len(seq) == H):
+            raise ValueError(f"{seq_key} is not a list of length {H}.")
+        sequences[seq_key] = seq
+    return sequences
 
-    OPENAI_KEY = os.environ['OPENAI_KEY']
-    openai = OpenAI(api_key=OPENAI_KEY)
+def query_llm_for_plans(x_init, v_init, H, K, dt, m, k_spring, x_goal):
+    prompt = build_plan_prompt(x_init, v_init, H, K, dt, m, k_spring, x_goal)
 
-    response = openai.chat.completions.create(
+    response = get_client().chat.completions.create(
         model="gpt-4o-mini",
         messages=[{"role":"user","content":prompt}],
         temperature=TEMPERATURE,
@@ -110,35 +311,84 @@ Do not use ```python tags, no extra commentary, just return the dictionary.
     print(plan_str)
     # Attempt parsing
     try:
-        plans = ast.literal_eval(plan_str)
-        # Expecting a dict with sequence_i keys
-        if not isinstance(plans, dict):
-            raise ValueError("LLM did not return a dictionary.")
-        # Check each sequence is list of length H
-        for i in range(1, K+1):
-            seq_key = f"sequence_{i}"
-            if seq_key not in plans:
-                raise ValueError(f"Key {seq_key} not found.")
-            seq = plans[seq_key]
-            if not (isinstance(seq, list) and len(seq) == H):
-                raise ValueError(f"{seq_key} is not a list of length {H}.")
+        plans = parse_plans(plan_str, H, K)
     except Exception as e:
         print("Error parsing LLM output, returning zeros:", e)
         # If parsing fails, just return K zero sequences
         plans = {f"sequence_{i}": [0.0]*H for i in range(1,K+1)}
     return plans
 
-def get_best_llm_plan(x, v, H, K, dt, m, k_spring, x_goal, Qx, Qv, Qu):
-    plans = query_llm_for_plans(x, v, H, K, dt, m, k_spring, x_goal)
+async def query_llm_for_plans_async(x_init, v_init, H, K, dt, m, k_spring, x_goal,
+                                    num_requests=3, max_concurrency=3, min_sequences=None, timeout=None):
+    # Split the K candidates over num_requests concurrent requests (at most
+    # max_concurrency in flight) and return as soon as min_sequences valid
+    # sequences have arrived or timeout seconds have passed.
+    if min_sequences is None:
+        min_sequences = K
+    sizes = [K // num_requests + (1 if i < K % num_requests else 0) for i in range(num_requests)]
+    sizes = [k for k in sizes if k > 0]
 
-    best_cost = float('inf')
-    best_plan = [0.0]*H
-    for i in range(1, K+1):
-        candidate = plans[f"sequence_{i}"]
-        cost = simulate_sequence(x, v, candidate, dt, m, k_spring, x_goal, Qx, Qv, Qu)
+    client = get_async_client()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def request(i, k):
+        prompt = build_plan_prompt(x_init, v_init, H, k, dt, m, k_spring, x_goal)
+        async with semaphore:
+            response = await client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[{"role":"user","content":prompt}],
+                temperature=TEMPERATURE,
+                max_tokens=500,
+                # Distinct seeds so identical prompts give different candidates
+                seed=SEED + i
+            )
+        plan_str = response.choices[0].message.content.strip()
+        print(plan_str)
+        try:
+            return list(parse_plans(plan_str, H, k).values())
+        except Exception as e:
+            print("Error parsing LLM output, dropping request:", e)
+            return []
+
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    pending = {asyncio.create_task(request(i, k)) for i, k in enumerate(sizes)}
+    sequences = []
+    try:
+        while pending and len(sequences) < min_sequences:
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                print(f"LLM deadline reached with {len(sequences)} sequences")
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    print("LLM request failed:", task.exception())
+                else:
+                    sequences.extend(task.result())
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if not sequences:
+        # If every request failed, just return K zero sequences
+        sequences = [[0.0]*H for _ in range(K)]
+    return {f"sequence_{i+1}": seq for i, seq in enumerate(sequences)}
+
+def get_best_llm_plan(x, v, H, K, dt, m, k_spring, x_goal, Qx, Qv, Qu,
+                      num_requests=1, max_concurrency=3, timeout=None):
+    if num_requests > 1:
+        plans = run_async(query_llm_for_plans_async(x, v, H, K, dt, m, k_spring, x_goal,
+                                                    num_requests=num_requests,
+                                                    max_concurrency=max_concurrency,
+                                                    timeout=timeout))
+    else:
+        plans = query_llm_for_plans(x, v, H, K, dt, m, k_spring, x_goal)
+
+    candidates = list(plans.values())
+    costs = simulate_batch(x, v, candidates, dt, m, k_spring, x_goal, Qx, Qv, Qu)
+    for cost, candidate in zip(costs, candidates):
         print(cost,candidate)
-        if cost < best_cost:
-            best_cost = cost
-            best_plan = candidate
 
-    return best_plan
\ No newline at end of file
+    best_plan = candidates[int(np.argmin(costs))]
+    return best_plan
@@ -5,7 +5,7 @@ from matplotlib.animation import FuncAnimation
 from openai import OpenAI
 import ast
 import pandas as pd
-from lib import get_best_llm_plan
+from lib import get_best_llm_plan, use_mock_planner
 
 #LLM parameters
 SEED = 42
@@ -28,6 +28,15 @@ Qu = 0.1
 
 # Number of candidate sequences from LLM
 K = 5
+# Concurrent requests the K candidates are split over, their concurrency
+# limit and the deadline in seconds (None waits for all requests)
+NUM_REQUESTS = 1
+MAX_CONCURRENCY = 3
+LLM_TIMEOUT = None
+# Offline mock planner returning perturbed MPC plans after MOCK_LATENCY
+# seconds, for benchmarking without API access
+MOCK_LLM = False
+MOCK_LATENCY = 0.5
 
 # Simulation parameters
 T = 50
@@ -41,11 +50,16 @@ vs = [v0]
 us = [0]
 costs = [Qx*(x0 - x_goal)**2 + Qv*(v0)**2]
 
+if MOCK_LLM:
+    use_mock_planner(Qx, Qv, Qu, latency=MOCK_LATENCY)
+
 # Simulation loop
 x = x0
 v = v0
 for t in range(0, T, M):
-    u_plan = get_best_llm_plan(x, v, H, K, dt, m, k_spring, x_goal, Qx, Qv, Qu)
+    u_plan = get_best_llm_plan(x, v, H, K, dt, m, k_spring, x_goal, Qx, Qv, Qu,
+                               num_requests=NUM_REQUESTS, max_concurrency=MAX_CONCURRENCY,
+                               timeout=LLM_TIMEOUT)
 
     steps_to_apply = min(M, T - t)
     for i in range(steps_to_apply):
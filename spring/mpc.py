@@ -3,7 +3,7 @@ import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 import cvxpy as cp
 import pandas as pd
-from lib import solve_mpc
+from lib import solve_mpc, mpc_cache_stats
 
 # ------------------------------------------------------------
 # Model Predictive Control for a simple mass-spring system
@@ -54,6 +54,8 @@ M = 2   # number of steps to apply before replanning
 Qx = 100.0  # state error weight for position
 Qv = 100.0   # state error weight for velocity
 Qu = 0.1   # control effort weight
+u_min = None  # control bounds, set to 0.0 and 20.0 to match the LLM prompt
+u_max = None
 
 # Simulation parameters
 T = 50  # total simulation steps
@@ -78,7 +80,7 @@ x = x0
 v = v0
 for t in range(0, T, M):
     # Solve MPC
-    x_plan, v_plan, u_plan = solve_mpc(x, v, H, dt, m, k_spring, x_goal, Qx, Qv, Qu)
+    x_plan, v_plan, u_plan = solve_mpc(x, v, H, dt, m, k_spring, x_goal, Qx, Qv, Qu, u_min, u_max)
     steps_to_apply = min(M, T - t)
 
     for i in range(steps_to_apply):
@@ -95,6 +97,8 @@ for t in range(0, T, M):
         us.append(u)
         costs.append(c)
 
+print(f"MPC problem cache: {mpc_cache_stats['hits']} hits, {mpc_cache_stats['misses']} misses")
+
 # ------------------------------------------------------------
 # Animation
 # ------------------------------------------------------------
@@ -1,13 +1,15 @@
 #!/usr/bin/env python3
 
 import os
+import sys
 import json
-import openai
 from datasets import load_dataset
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from llm_client import get_client
+from checkpoint import load_checkpoint, append_checkpoint
 
-# Set your OpenAI API key via env var or directly here:
-# openai.api_key = "sk-XXXX"
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# Set your OpenAI API key via env var
+client = get_client(os.getenv("OPENAI_API_KEY"))
 
 # A system prompt that guides the model to produce only a valid patch.
 SYSTEM_PROMPT = """\
@@ -34,6 +36,11 @@ Base Commit: {base_commit}
 Please produce a unified diff patch that fixes the issue above. 
 """
 
+# Predictions are appended to this checkpoint as they are generated, with
+# RESUME set instances already in it are skipped
+CHECKPOINT_FILENAME = "predictions_swebench.jsonl"
+RESUME = True
+
 def generate_patch_for_instance(instance, openai_model="gpt-4"):
     """
     Given a single SWE-bench instance and a model name, query OpenAI to produce a patch.
@@ -50,7 +57,7 @@ def generate_patch_for_instance(instance, openai_model="gpt-4"):
         base_commit=base_commit
     )
 
-    response = openai.ChatCompletion.create(
+    response = client.chat.completions.create(
         model=openai_model,
         messages=[
             {"role": "system", "content": SYSTEM_PROMPT},
@@ -61,7 +68,7 @@ def generate_patch_for_instance(instance, openai_model="gpt-4"):
     )
 
     # The patch is in the assistant's reply
-    patch_text = response["choices"][0]["message"]["content"]
+    patch_text = response.choices[0].message.content
     return patch_text.strip()
 
 def main():
@@ -71,7 +78,16 @@ def main():
     
     predictions = []
 
+    if not RESUME and os.path.exists(CHECKPOINT_FILENAME):
+        os.remove(CHECKPOINT_FILENAME)
+    completed = load_checkpoint(CHECKPOINT_FILENAME)
+    print(f"Resuming with {len(completed)} completed instances")
+
     for i, instance in enumerate(dataset):
+        if instance["instance_id"] in completed:
+            predictions.append(completed[instance["instance_id"]])
+            continue
+
         try:
             # Generate the patch
             patch = generate_patch_for_instance(
@@ -87,6 +103,7 @@ def main():
             }
             
             predictions.append(prediction_record)
+            append_checkpoint(CHECKPOINT_FILENAME, instance["instance_id"], prediction_record)
             
             # Print or log progress as needed
             if (i + 1) % 10 == 0:
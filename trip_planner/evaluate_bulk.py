@@ -0,0 +1,166 @@
+"""Bulk eval script for Trip Planning.
+
+Scores several solution files in one run, e.g.
+
+  python evaluate_bulk.py --solution_paths=output/solution.json,output/llmpc_solution_7.json
+
+Every response is parsed once into a table with one row per (file, example),
+scores are computed on padded NumPy arrays and reported per number of cities.
+The exact-match score is the same as compute_score in evaluate_llmpc.py.
+"""
+
+import itertools
+import json
+
+from absl import app
+from absl import flags
+import numpy as np
+import pandas as pd
+
+from lib import parse_response
+
+
+_SOLUTION_PATHS = flags.DEFINE_list(
+    'solution_paths',
+    ['output/solution.json'],
+    'comma separated paths to the solution files to compare.',
+)
+
+_RESPONSE_KEY = flags.DEFINE_string(
+    'response_key',
+    'pred_5shot_pro',
+    'key of the model response in each example.',
+)
+
+_OUTPUT_PATH = flags.DEFINE_string(
+    'output_path',
+    None,
+    'optional CSV path for the per-example scores.',
+)
+
+
+def load_solutions(
+    paths: list[str], response_key: str = 'pred_5shot_pro'
+) -> pd.DataFrame:
+  """Parse the solution files into one row per (file, example).
+
+  Identical responses, e.g. shared between runs, are only parsed once.
+
+  Args:
+    paths: Paths to solution files in json format.
+    response_key: Key of the model response in each example.
+
+  Returns:
+    DataFrame with columns file, example_id, num_cities, cities, durations,
+    pred_cities and pred_durations.
+  """
+  parsed = {}
+  rows = []
+  for path in paths:
+    with open(path) as f:
+      data = json.load(f)
+    for example_id, item in data.items():
+      response = item.get(response_key) or ''
+      cities = [x for x in item['cities'].split('**') if x]
+      key = (response, item['cities'])
+      if key not in parsed:
+        parsed[key] = parse_response(response, cities)
+      plan = parsed[key]
+      rows.append({
+          'file': path,
+          'example_id': example_id,
+          'num_cities': len(cities),
+          'cities': cities,
+          'durations': [int(x) for x in item['durations'].split('**') if x],
+          'pred_cities': [city for city, _ in plan],
+          'pred_durations': [days for _, days in plan],
+      })
+  return pd.DataFrame(rows)
+
+
+def _pad(
+    values: np.ndarray, lengths: np.ndarray, width: int, fill: int
+) -> np.ndarray:
+  """Lay out the concatenated rows of values in an array cut or padded to width."""
+  rows = np.repeat(np.arange(len(lengths)), lengths)
+  cols = np.arange(len(values)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+  keep = cols < width
+  out = np.full((len(lengths), width), fill, dtype=np.int64)
+  out[rows[keep], cols[keep]] = values[keep]
+  return out
+
+
+def score_solutions(df: pd.DataFrame) -> pd.DataFrame:
+  """Add the exact-match and prefix-match scores to a load_solutions table.
+
+  prefix_match is the fraction of ground truth stays matched in order before
+  the first mismatch, exact_match is 1 when all of them match.
+
+  Args:
+    df: Table returned by load_solutions.
+
+  Returns:
+    The table with prefix_len, prefix_match and exact_match columns.
+  """
+  width = int(df['num_cities'].max()) if len(df) else 0
+  gold_lengths = df['num_cities'].to_numpy()
+  pred_lengths = df['pred_cities'].map(len).to_numpy()
+
+  # Shared integer codes for ground truth and predicted city names
+  codes, _ = pd.factorize(pd.Series(
+      list(itertools.chain.from_iterable(df['cities']))
+      + list(itertools.chain.from_iterable(df['pred_cities'])),
+      dtype=object,
+  ))
+  num_gold = int(gold_lengths.sum())
+
+  def flat(column):
+    return np.fromiter(itertools.chain.from_iterable(df[column]), dtype=np.int64)
+
+  gold_cities = _pad(codes[:num_gold], gold_lengths, width, -1)
+  gold_days = _pad(flat('durations'), gold_lengths, width, -1)
+  pred_cities = _pad(codes[num_gold:], pred_lengths, width, -2)
+  pred_days = _pad(flat('pred_durations'), pred_lengths, width, -2)
+
+  # Padding never matches, so the leading run of matches stops at the end of
+  # the ground truth or of the prediction
+  match = (gold_cities == pred_cities) & (gold_days == pred_days)
+  prefix_len = np.cumprod(match, axis=1).sum(axis=1)
+
+  df = df.copy()
+  df['prefix_len'] = prefix_len
+  df['prefix_match'] = prefix_len / df['num_cities']
+  df['exact_match'] = (prefix_len == df['num_cities']).astype(float)
+  return df
+
+
+def summarize(df: pd.DataFrame, column: str = 'exact_match') -> pd.DataFrame:
+  """Mean score per number of cities (rows) and solution file (columns)."""
+  table = df.pivot_table(
+      index='num_cities', columns='file', values=column, aggfunc='mean'
+  )
+  table.loc['all'] = df.groupby('file')[column].mean()
+  return table
+
+
+def main(_):
+  df = score_solutions(
+      load_solutions(_SOLUTION_PATHS.value, _RESPONSE_KEY.value)
+  )
+
+  counts = df.groupby('file').size()
+  for path in _SOLUTION_PATHS.value:
+    print(f'{path}: {counts[path]} samples')
+  print('\nEM Accuracy:')
+  print(summarize(df, 'exact_match').to_string(float_format='{:.4f}'.format))
+  print('\nPrefix-match Accuracy:')
+  print(summarize(df, 'prefix_match').to_string(float_format='{:.4f}'.format))
+
+  if _OUTPUT_PATH.value:
+    df.drop(columns=['cities', 'durations', 'pred_cities', 'pred_durations']).to_csv(
+        _OUTPUT_PATH.value, index=False
+    )
+
+
+if __name__ == '__main__':
+  app.run(main)
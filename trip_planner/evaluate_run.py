@@ -15,12 +15,13 @@
 """Eval Script for Trip Planning."""
 
 import json
-import re
 from typing import Any
 
 from absl import app
 from absl import flags
 
+from lib import parse_response
+
 
 _DATA_PATH = flags.DEFINE_string(
     'data_path',
@@ -29,59 +30,6 @@ _DATA_PATH = flags.DEFINE_string(
 )
 
 
-def parse_response(response: str):
-  """Parse the response.
-
-  Returns a parsed plan in a list of (city, stay_days) tuples.
-
-  Args:
-    response: Raw response from the model.
-
-  Returns:
-    Structured plan after parsing.
-  """
-  pattern_visit = r'\d+-\d+'
-  pattern_flight = r'.*Day (\d+).*from (\w+) to (\w+)'
-  pattern_days = r'European cities for (\d+) days'
-
-  days, flights, flight_days = [], [], []
-  total_days = None
-  for piece in response.split('\n'):
-    days_match = re.findall(pattern_days, piece)
-    if days_match:
-      total_days = int(days_match[0])
-
-    visit_match = re.findall(pattern_visit, piece)
-    if visit_match:
-      days.append(visit_match[0])
-      end_day = int(visit_match[0].split('-')[1])
-      # Reach the end of the plan, stop to avoid parsing alternative plans.
-      if end_day == total_days:
-        break
-    flight_match = re.findall(pattern_flight, piece)
-    if flight_match:
-      flights.append(flight_match[0])
-
-  visit_cities, parsed_plan = [], []
-  for flight_day, begin_city, end_city in flights:
-    flight_days.append(int(flight_day))
-    if not visit_cities:
-      visit_cities.append(begin_city)
-      visit_cities.append(end_city)
-    else:
-      visit_cities.append(end_city)
-
-  if not days or not flights or not visit_cities:
-    return []
-  last_day = int(days[-1].split('-')[1])
-  flight_days = [1] + flight_days + [last_day]
-  for i, visit_city in enumerate(visit_cities):
-    city_stay = flight_days[i + 1] - flight_days[i] + 1
-    parsed_plan.append((visit_city, city_stay))
-
-  return parsed_plan
-
-
 def compute_example_score(cities: str, durations: str, parsed_plan: list[Any]):
   """Compute the exact-match accuracy.
 
@@ -125,7 +73,10 @@ def compute_score(
   Returns:
     Exact-match score at the sample level.
   """
-  parsed_plans = [parse_response(response) for response in responses]
+  parsed_plans = [
+      parse_response(response, [x for x in city.split('**') if x])
+      for city, response in zip(cities, responses)
+  ]
   hard_scores = [
       compute_example_score(city, duration, parsed_plan)
       for city, duration, parsed_plan in zip(cities, durations, parsed_plans)
@@ -1,57 +1,125 @@
 import ast
+import functools
 import re
-
-def parse_response(response: str):
-  """Parse the response.
-
-  Returns a parsed plan in a list of (city, stay_days) tuples.
+from typing import NamedTuple, Optional, Sequence
+
+class Visit(NamedTuple):
+  start_day: int
+  end_day: int
+  span: tuple[int, int]
+
+class Flight(NamedTuple):
+  day: int
+  from_city: str
+  to_city: str
+  span: tuple[int, int]
+
+class ScannedResponse(NamedTuple):
+  plan: list[tuple[str, int]]
+  total_days: Optional[int]
+  visits: list[Visit]
+  flights: list[Flight]
+
+# City names are the example's cities when they are known, longest first so
+# that "San Francisco" is not cut short, or else any single word as in the
+# original parser. Words after a city ("to London On arrival") are not part of
+# it.
+def _city_pattern(cities: tuple[str, ...]) -> str:
+  names = sorted(set(cities), key=len, reverse=True)
+  return ''.join(re.escape(city) + r'(?!\w)|' for city in names) + r'\w+'
+
+# Single scanner over the whole response, one per set of cities. The
+# lookahead lets the engine skip positions that can not start a token.
+# "Day 1-3" is one token, giving both the day and the visit.
+@functools.lru_cache(maxsize=1024)
+def _token_re(cities: tuple[str, ...] = ()) -> re.Pattern:
+  city = _city_pattern(cities)
+  return re.compile(
+      r"(?=[\nD\dfE])(?:"
+      r"(?P<newline>\n)"
+      r"|Day (?P<day>\d+)(?:-(?P<day_end>\d+))?"
+      r"|(?P<start>\d+)-(?P<end>\d+)"
+      r"|from (?P<src>" + city + r") to (?P<dst>" + city + r")"
+      r"|European cities for (?P<total>\d+) days)"
+  )
+
+def scan_response(
+    response: str, cities: Optional[Sequence[str]] = None
+) -> ScannedResponse:
+  """Scan the response once, keeping the spans of the matched tokens.
+
+  Each line contributes at most one visit (its first day range) and one
+  flight (its last "from X to Y" with the last "Day N" before it). Scanning
+  stops at the visit that ends on the total number of days, to avoid parsing
+  alternative plans.
 
   Args:
     response: Raw response from the model.
+    cities: Cities of the example, which may span several words. Without
+      them, city names are single words.
 
   Returns:
-    Structured plan after parsing.
+    The parsed plan with the visits and flights it was built from.
   """
-  pattern_visit = r'\d+-\d+'
-  pattern_flight = r'.*Day (\d+).*from (\w+) to (\w+)'
-  pattern_days = r'European cities for (\d+) days'
-
-  days, flights, flight_days = [], [], []
   total_days = None
-  for piece in response.split('\n'):
-    days_match = re.findall(pattern_days, piece)
-    if days_match:
-      total_days = int(days_match[0])
-
-    visit_match = re.findall(pattern_visit, piece)
-    if visit_match:
-      days.append(visit_match[0])
-      end_day = int(visit_match[0].split('-')[1])
-      # Reach the end of the plan, stop to avoid parsing alternative plans.
-      if end_day == total_days:
-        break
-    flight_match = re.findall(pattern_flight, piece)
-    if flight_match:
-      flights.append(flight_match[0])
+  visits, flights = [], []
+  line_total = line_visit = line_flight = day = None
+
+  for match in _token_re(tuple(cities or ())).finditer(response + '\n'):
+    kind = match.lastgroup
+    if kind == 'newline':
+      if line_total is not None:
+        total_days = line_total
+      if line_visit is not None:
+        visits.append(line_visit)
+        if line_visit.end_day == total_days:
+          break
+      if line_flight is not None:
+        flights.append(line_flight)
+      line_total = line_visit = line_flight = day = None
+    elif kind == 'day' or kind == 'day_end':
+      day = match
+      if kind == 'day_end' and line_visit is None:
+        line_visit = Visit(int(match.group('day')), int(match.group('day_end')),
+                           (match.start('day'), match.end('day_end')))
+    elif kind == 'end':
+      if line_visit is None:
+        line_visit = Visit(int(match.group('start')), int(match.group('end')), match.span())
+    elif kind == 'dst':
+      if day is not None:
+        line_flight = Flight(int(day.group('day')), match.group('src'),
+                             match.group('dst'), (day.start(), match.end()))
+    elif line_total is None:
+      line_total = int(match.group('total'))
 
   visit_cities, parsed_plan = [], []
-  for flight_day, begin_city, end_city in flights:
-    flight_days.append(int(flight_day))
+  for flight in flights:
     if not visit_cities:
-      visit_cities.append(begin_city)
-      visit_cities.append(end_city)
-    else:
-      visit_cities.append(end_city)
-
-  if not days or not flights or not visit_cities:
-    return []
-  last_day = int(days[-1].split('-')[1])
-  flight_days = [1] + flight_days + [last_day]
+      visit_cities.append(flight.from_city)
+    visit_cities.append(flight.to_city)
+
+  if not visits or not flights:
+    return ScannedResponse(parsed_plan, total_days, visits, flights)
+  flight_days = [1] + [flight.day for flight in flights] + [visits[-1].end_day]
   for i, visit_city in enumerate(visit_cities):
     city_stay = flight_days[i + 1] - flight_days[i] + 1
     parsed_plan.append((visit_city, city_stay))
 
-  return parsed_plan
+  return ScannedResponse(parsed_plan, total_days, visits, flights)
+
+def parse_response(response: str, cities: Optional[Sequence[str]] = None):
+  """Parse the response.
+
+  Returns a parsed plan in a list of (city, stay_days) tuples.
+
+  Args:
+    response: Raw response from the model.
+    cities: Cities of the example, see scan_response.
+
+  Returns:
+    Structured plan after parsing.
+  """
+  return scan_response(response, cities).plan
 
 def extract_constraints(task:str, client)->str:
     system = "You are an intelligent AI assistant."
@@ -166,6 +234,51 @@ def parse_constraints(resp:str):
         print(f"failed to parse {resp}")
         return None
 
+def check_trip_step(constraints, state, prev_city, city, days):
+    """
+    Applies one (city, num_days) stop of a trip to the checker state.
+
+    :param state: (current_day, errors) before this stop, it is not modified.
+    :param prev_city: City of the previous stop, None for the first one.
+    :return: (current_day, errors) after this stop.
+    """
+    current_day, errors = state
+    errors = list(errors)
+
+    # 1) Check that the city is defined in constraints
+    if city not in constraints:
+        errors.append(f"City '{city}' not found in constraints.")
+        # Skip further checks for this city
+        return current_day + days, errors
+
+    city_constraints = constraints[city]
+
+    # 2) Check number of days matches
+    expected_days = city_constraints['num_days']
+    if days != expected_days:
+        errors.append(
+            f"City '{city}' days mismatch: expected {expected_days}, got {days}"
+        )
+
+    # 3) Check day constraints (if non-empty, the start day must be in them)
+    if city_constraints['day_constraints']:
+        allowed_days = city_constraints['day_constraints']
+        if current_day not in allowed_days:
+            errors.append(
+                f"City '{city}' start day {current_day} not in allowed days {allowed_days}"
+            )
+
+    # 4) Check flight connectivity from the previous city
+    if prev_city is not None:
+        if city not in constraints[prev_city]['flights']:
+            errors.append(
+                f"City '{city}' is not reachable from '{prev_city}'. "
+                f"Allowed flights from '{prev_city}' are {constraints[prev_city]['flights']}."
+            )
+
+    # Advance the current day counter by the number of days spent in this city
+    return current_day + days - 1, errors
+
 def check_trip_constraints(constraints, trip):
     """
     Checks whether a trip defined by a list of (city, num_days) tuples
@@ -184,44 +297,44 @@ def check_trip_constraints(constraints, trip):
     :return: List of strings describing any violations of the constraints.
     """
 
-    errors = []
-    current_day = 1  # We assume day counting starts at 1
+    state = (1, [])  # We assume day counting starts at 1
+    prev_city = None
 
-    for i, (city, days) in enumerate(trip):
-        # 1) Check that the city is defined in constraints
-        if city not in constraints:
-            errors.append(f"City '{city}' not found in constraints.")
-            # Skip further checks for this city
-            current_day += days
-            continue
+    for city, days in trip:
+        state = check_trip_step(constraints, state, prev_city, city, days)
+        prev_city = city
 
-        city_constraints = constraints[city]
+    return state[1]
 
-        # 2) Check number of days matches
-        expected_days = city_constraints['num_days']
-        if days != expected_days:
-            errors.append(
-                f"City '{city}' days mismatch: expected {expected_days}, got {days}"
-            )
+class TripPrefixValidator:
+    """
+    Checks many trips against the same constraints, sharing the work for
+    common prefixes. The checker state after every stop is stored in a trie
+    keyed by (city, num_days), so successive plans that only change their
+    tail are checked from the first differing stop.
+    """
 
-        # 3) Check day constraints (if non-empty, the start day must be in them)
-        if city_constraints['day_constraints']:
-            allowed_days = city_constraints['day_constraints']
-            if current_day not in allowed_days:
-                errors.append(
-                    f"City '{city}' start day {current_day} not in allowed days {allowed_days}"
-                )
-
-        # 4) Check flight connectivity from the previous city
-        if i > 0:
-            prev_city = trip[i - 1][0]
-            if city not in constraints[prev_city]['flights']:
-                errors.append(
-                    f"City '{city}' is not reachable from '{prev_city}'. "
-                    f"Allowed flights from '{prev_city}' are {constraints[prev_city]['flights']}."
-                )
-
-        # Advance the current day counter by the number of days spent in this city
-        current_day += days-1
-
-    return errors
\ No newline at end of file
+    def __init__(self, constraints):
+        self.constraints = constraints
+        # Trie node: (children keyed by stop, checker state after the stop)
+        self.root = ({}, (1, []))
+        self.steps_checked = 0
+        self.steps_reused = 0
+
+    def check(self, trip):
+        """
+        Same result as check_trip_constraints(self.constraints, trip).
+        """
+        children, state = self.root
+        prev_city = None
+        for city, days in trip:
+            node = children.get((city, days))
+            if node is None:
+                node = ({}, check_trip_step(self.constraints, state, prev_city, city, days))
+                children[(city, days)] = node
+                self.steps_checked += 1
+            else:
+                self.steps_reused += 1
+            children, state = node
+            prev_city = city
+        return state[1]
@@ -1,7 +1,13 @@
 import os
-from openai import OpenAI
+import sys
 import json
-from lib import parse_response, check_trip_constraints
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from llm_client import get_client
+from checkpoint import load_checkpoint, append_checkpoint
+from dataset_store import load_dataset
+from lib import parse_response, check_trip_constraints, TripPrefixValidator
+from mock_llm import mock_backend
+from solver import solve_trip, format_plan
 
 system_prompt = """
 You are an expert travel planner assistant. Your goal is to create and refine travel plans that satisfy all given constraints.
@@ -89,20 +95,46 @@ Your current trip plan is:
 NUM_PLANNING_STEPS = 7  
 SEED = 42
 
+# Offline mock LLM returning ground truth plans with injected errors after
+# MOCK_LATENCY seconds, for benchmarking without API access
+MOCK_LLM = False
+MOCK_LATENCY = 1.0
+
+# Skip examples already completed in the checkpoint of a previous run
+RESUME = True
+
+# Replace plans that still violate the constraints after the last iteration
+# with the first itinerary found by the exact solver
+REPAIR_WITH_SOLVER = False
+
 # Clean and recreate output directory
 output_dir = "./output/llmpc"
 if not os.path.exists(output_dir):
     os.makedirs(output_dir)
 
-# Load trip planning data
-with open("/home/gabriel/projects/llmpc/trip_planner/data/trip_planning_reduced.json", 'r') as f:
-    trip_data = json.load(f)
+# Load trip planning data, a .arrow file converted with dataset_store.py is
+# loaded lazily instead
+trip_data = load_dataset("/home/gabriel/projects/llmpc/trip_planner/data/trip_planning_reduced.json")
 
-client = OpenAI(api_key=os.getenv("OPENAI_KEY"))
+if MOCK_LLM:
+    client = get_client(backend=mock_backend(trip_data, latency=MOCK_LATENCY))
+else:
+    client = get_client(os.getenv("OPENAI_KEY"))
 solutions = {}
 
+# Finished examples are appended to the checkpoint as they complete
+checkpoint_path = f"./output/llmpc_solution_{NUM_PLANNING_STEPS}.jsonl"
+if not RESUME and os.path.exists(checkpoint_path):
+    os.remove(checkpoint_path)
+completed = load_checkpoint(checkpoint_path)
+print(f"Resuming with {len(completed)} completed examples")
+
 # Run planner for each test example
 for k, d in list(trip_data.items()):
+    if k in completed:
+        solutions[k] = completed[k]
+        continue
+
     print(f"\nProcessing example {k}")
     
     output_log = f"{output_dir}/trip_plan_{k}.md"
@@ -111,6 +143,10 @@ for k, d in list(trip_data.items()):
 
     current_plan = ""
     constraints_dict = d['constraints']
+    cities = [x for x in d['cities'].split('**') if x]
+    # Successive plans mostly only change their tail, reuse the checks of
+    # the unchanged prefix
+    validator = TripPrefixValidator(constraints_dict)
 
     # Run iterations of planning
     for iteration in range(NUM_PLANNING_STEPS):
@@ -118,14 +154,14 @@ for k, d in list(trip_data.items()):
         
         feedback_string = ""
         if current_plan:
-            plan = parse_response(current_plan)
-            errors = check_trip_constraints(constraints_dict, plan)
+            plan = parse_response(current_plan, cities)
+            errors = validator.check(plan)
 
             if len(errors) == 0:
                 print(f"Plan {plan} satisfies the constraints, terminating")
                 break
             else:
-                feedback_string = f"There are errors in the plan, please fix them: {'\n*'.join(errors)}"
+                feedback_string = "There are errors in the plan, please fix them: " + "\n*".join(errors)
 
         prompt = instruction_prompt.format(
             task=d['prompt_0shot'],
@@ -154,12 +190,21 @@ for k, d in list(trip_data.items()):
         else:
             current_plan = content.strip()
 
+    if REPAIR_WITH_SOLVER and constraints_dict:
+        if not current_plan or check_trip_constraints(constraints_dict, parse_response(current_plan, cities)):
+            itineraries = solve_trip(constraints_dict)
+            if itineraries:
+                current_plan = format_plan(itineraries[0])
+                with open(output_log, 'a') as f:
+                    f.write(f"\nRepaired with solver\n{current_plan}\n")
+
     solutions[k] = {
         'num_cities':d['num_cities'],
         'pred_5shot_pro': current_plan,
         'cities': d['cities'],
         'durations': d['durations']
     }
+    append_checkpoint(checkpoint_path, k, solutions[k])
 
 # Save solutions
 with open(f"./output/llmpc_solution_{NUM_PLANNING_STEPS}.json", 'w') as f:
@@ -0,0 +1,37 @@
+import os
+import sys
+import random
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from llm_client import MockBackend
+from solver import format_plan
+
+# Offline stand-in for the trip planner LLM. Answers each request with the
+# ground truth itinerary of the example whose task appears in the prompt, with
+# two cities swapped at a configurable rate, so the planning loops can be
+# benchmarked without API access.
+
+def golden_plan_responder(data, error_rate=0.3, seed=42):
+    rng = random.Random(seed)
+    examples = list(data.values())
+
+    def find_example(prompt):
+        for d in examples:
+            if d["prompt_0shot"] in prompt or d["prompt_5shot"] == prompt:
+                return d
+        raise KeyError("No example found for prompt")
+
+    def respond(request):
+        prompt = request["messages"][-1]["content"]
+        d = find_example(prompt)
+        cities = [x for x in d["cities"].split("**") if x]
+        durations = [int(x) for x in d["durations"].split("**") if x]
+        if len(cities) > 1 and rng.random() < error_rate:
+            i = rng.randrange(len(cities) - 1)
+            cities[i], cities[i+1] = cities[i+1], cities[i]
+            durations[i], durations[i+1] = durations[i+1], durations[i]
+        return "PLAN:\n" + format_plan(list(zip(cities, durations)))
+
+    return respond
+
+def mock_backend(data, error_rate=0.3, latency=0.0, seed=42):
+    return MockBackend(golden_plan_responder(data, error_rate, seed), latency)
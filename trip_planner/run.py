@@ -1,10 +1,12 @@
-from openai import OpenAI
 import os
+import sys
 import json
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from llm_client import get_client
 
-OPENAI_KEY = os.environ['OPENAI_KEY']
+OPENAI_KEY = os.getenv('OPENAI_KEY')
 
-openai = OpenAI(api_key=OPENAI_KEY)
+openai = get_client(OPENAI_KEY)
 
 fn = "/home/gabriel/projects/llmpc/trip_planner/data/trip_planning_reduced.json"
 f = open(fn,'r')
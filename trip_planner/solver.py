@@ -0,0 +1,83 @@
+from typing import List, Tuple
+
+# Exact solver for the trip planning task. Enumerates the orderings of all
+# cities in a constraints dict (as produced by lib.parse_constraints) that
+# satisfy lib.check_trip_constraints, by DFS over (visited set, current city).
+#
+# The day a city is entered only depends on the set of cities visited before
+# it, since every flight day counts for both cities. States that failed once
+# are remembered and never expanded again.
+
+def solve_trip(constraints: dict, max_solutions: int = 1, cover_day_constraints: bool = False) -> List[List[Tuple[str, int]]]:
+    """Return up to max_solutions valid itineraries as lists of (city, num_days).
+
+    max_solutions=None returns all of them. With cover_day_constraints the stay
+    in a city has to cover all of its day_constraints instead of only starting
+    on one of them.
+    """
+    cities = list(constraints.keys())
+    n = len(cities)
+    index = {city: i for i, city in enumerate(cities)}
+    days = [constraints[city]['num_days'] for city in cities]
+    allowed = [set(constraints[city]['day_constraints']) for city in cities]
+    flights = [[index[c] for c in constraints[city]['flights'] if c in index] for city in cities]
+
+    def start_ok(i, day):
+        if not allowed[i]:
+            return True
+        if cover_day_constraints:
+            return min(allowed[i]) >= day and max(allowed[i]) <= day + days[i] - 1
+        return day in allowed[i]
+
+    # Latest day each constrained city can still be entered
+    latest_start = [max(a) if a else None for a in allowed]
+
+    solutions = []
+    dead = set()
+    full = (1 << n) - 1
+
+    def dfs(mask, cur, day, path):
+        if mask == full:
+            solutions.append([(cities[i], days[i]) for i in path])
+            return True
+        if (mask, cur) in dead:
+            return False
+
+        # Prune when a constrained city can no longer be entered in time
+        for i in range(n):
+            if not mask & (1 << i) and latest_start[i] is not None and day > latest_start[i]:
+                dead.add((mask, cur))
+                return False
+
+        found = False
+        for nxt in flights[cur]:
+            if mask & (1 << nxt) or not start_ok(nxt, day):
+                continue
+            path.append(nxt)
+            found = dfs(mask | (1 << nxt), nxt, day + days[nxt] - 1, path) or found
+            path.pop()
+            if max_solutions is not None and len(solutions) >= max_solutions:
+                return True
+        if not found:
+            dead.add((mask, cur))
+        return found
+
+    for first in range(n):
+        if not start_ok(first, 1):
+            continue
+        dfs(1 << first, first, days[first], [first])
+        if max_solutions is not None and len(solutions) >= max_solutions:
+            break
+
+    return solutions
+
+def format_plan(trip: List[Tuple[str, int]]) -> str:
+    # Format an itinerary in the plan format used by the prompts
+    lines = []
+    day = 1
+    for i, (city, days) in enumerate(trip):
+        if i > 0:
+            lines.append(f"**Day {day}:** Fly from {trip[i-1][0]} to {city}.")
+        lines.append(f"**Day {day}-{day + days - 1}:** Visit {city} for {days} days.")
+        day += days - 1
+    return "\n".join(lines)